@@ -0,0 +1,171 @@
+import argparse
+import asyncio
+import json
+import os
+import random
+import resource
+import string
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from mock_cops_api import add_mock_arguments, mock_from_arguments
+
+class FakeChannel:
+    def __init__(self, channel_id: int):
+        self.id = channel_id
+        self.messages = 0
+        self.files = 0
+
+    async def send(self, content=None, file=None):
+        self.messages += 1
+        if file is not None:
+            self.files += 1
+
+def percentile(values, pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+def random_names(count: int, seed: int):
+    rng = random.Random(seed)
+    return [
+        "".join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(3, 12)))
+        for _ in range(count)
+    ]
+
+def configure_environment(args, api_url: str):
+    # name_cops reads its CONFIG from the environment at import time
+    os.environ.update({
+        'PROFILE_API_URL': api_url,
+        'REQUEST_RATE': str(args.rate),
+        'REQUEST_BURST': str(max(1.0, args.rate / 10)),
+        'REQUEST_TIMEOUT': str(args.timeout),
+        'JOB_CONCURRENCY': str(args.concurrency),
+        'LOOKUP_BATCH_SIZE': str(args.lookup_batch),
+        'CACHE_MAX_SIZE': '0' if args.no_cache else '100000',
+        'DISCORD_MESSAGE_DELAY': '0',
+        'JOB_DB_PATH': os.path.join(args.workdir, 'bench_jobs.db'),
+        'DICT_CACHE_PATH': os.path.join(args.workdir, 'bench_dict.bin'),
+        'TAKEN_FILTER_PATH': os.path.join(args.workdir, 'bench_taken.bin'),
+        'WORKER_PROCESSES': str(args.workers),
+        'WORKER_SOCKET': os.path.join(args.workdir, 'workers.sock'),
+    })
+
+async def bench_check(nc, names, concurrency: int):
+    latencies = []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def check(name):
+        async with semaphore:
+            started = time.perf_counter()
+            await nc.check_username_availability(name)
+            latencies.append(time.perf_counter() - started)
+
+    await asyncio.gather(*(check(name) for name in names))
+    return latencies
+
+async def start_workers(nc):
+    await nc.start_workers()
+    while nc.worker_pool is not None and len(nc.worker_pool._workers) < nc.worker_pool.size:
+        await asyncio.sleep(0.05)
+
+async def bench_loop(nc, names):
+    latencies = []
+    check_chunk = nc.check_chunk
+
+    async def timed_chunk(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return await check_chunk(*args, **kwargs)
+        finally:
+            latencies.append(time.perf_counter() - started)
+
+    nc.check_chunk = timed_chunk
+    try:
+        usernames = nc.UsernameList()
+        for name in names:
+            usernames.append(name)
+        data = nc.add_user_data(1, nc.shared_lists.acquire(usernames))
+        await nc.job_store.save_job(1, data.shared)
+        channel, hits_channel = FakeChannel(1), FakeChannel(2)
+        await nc.subscribe(data, channel, hits_channel).task
+        await nc.output_pipeline.drain()
+    finally:
+        nc.check_chunk = check_chunk
+    return latencies
+
+async def run(args):
+    mock = mock_from_arguments(args, timeout_delay=args.timeout + 1)
+    runner, api_url = await mock.start()
+    configure_environment(args, api_url)
+    import name_cops as nc
+
+    names = random_names(args.names, args.seed or 0)
+    if args.mode == "loop":
+        await start_workers(nc)
+    if args.trace_memory:
+        tracemalloc.start()
+    started = time.perf_counter()
+    try:
+        if args.mode == "check":
+            latencies = await bench_check(nc, names, args.concurrency)
+        else:
+            latencies = await bench_loop(nc, names)
+        elapsed = time.perf_counter() - started
+    finally:
+        if nc.worker_pool is not None:
+            await nc.worker_pool.close()
+        await nc.api_client.close()
+        await nc.job_store.close()
+        await runner.cleanup()
+
+    report = {
+        'mode': args.mode,
+        'names': len(names),
+        'elapsed_s': round(elapsed, 3),
+        'names_per_s': round(len(names) / elapsed, 1) if elapsed else 0.0,
+        'p50_ms': round(percentile(latencies, 50) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 2),
+        'api_requests': mock.requests,
+        'max_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        'cache_hits': nc.availability_cache.hits,
+        'retries': sum(nc.retries.values.values()),
+        'circuit_trips': nc.circuit_breaker.trips,
+    }
+    if args.trace_memory:
+        report['traced_peak_kb'] = tracemalloc.get_traced_memory()[1] // 1024
+        tracemalloc.stop()
+    return report
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark name_cops against a local mock profile API")
+    parser.add_argument("mode", choices=["check", "loop"],
+                        help="check: drive check_username_availability directly; loop: run a headless /start job")
+    parser.add_argument("--names", type=int, default=2000, help="Number of generated usernames")
+    parser.add_argument("--concurrency", type=int, default=8, help="Concurrent checks (JOB_CONCURRENCY in loop mode)")
+    parser.add_argument("--lookup-batch", type=int, default=10, help="LOOKUP_BATCH_SIZE")
+    parser.add_argument("--rate", type=float, default=1000.0, help="Global REQUEST_RATE in requests/s")
+    parser.add_argument("--timeout", type=float, default=2.0, help="Client REQUEST_TIMEOUT in seconds")
+    parser.add_argument("--workers", type=int, default=0, help="WORKER_PROCESSES for loop mode")
+    parser.add_argument("--no-cache", action="store_true", help="Disable the availability cache")
+    parser.add_argument("--trace-memory", action="store_true", help="Report tracemalloc peak (slows the run)")
+    parser.add_argument("--json", action="store_true", help="Print the report as one JSON object")
+    add_mock_arguments(parser)
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as workdir:
+        args.workdir = workdir
+        report = asyncio.run(run(args))
+
+    if args.json:
+        print(json.dumps(report))
+    else:
+        for key, value in report.items():
+            print(f"{key:>16}: {value}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
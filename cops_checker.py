@@ -0,0 +1,1095 @@
+import aiohttp
+import argparse
+import asyncio
+import codecs
+import csv
+import hashlib
+import json
+import logging
+import math
+import os
+import random
+import re
+import struct
+import sys
+import time
+import zlib
+from array import array
+from collections import OrderedDict, deque
+from contextvars import ContextVar
+from email.utils import parsedate_to_datetime
+from enum import IntEnum
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, NamedTuple, Optional, Set, Tuple
+
+from cops_metrics import MetricsRegistry
+
+CONFIG = {
+    'MAX_USERNAMES': int(os.getenv('MAX_USERNAMES', '5000000')),
+    # Caps on the decompressed text and on its lines, duplicates included
+    'MAX_INPUT_BYTES': int(os.getenv('MAX_INPUT_BYTES', '200000000')),
+    'MAX_INPUT_LINES': int(os.getenv('MAX_INPUT_LINES', '10000000')),
+    'REQUEST_RATE': float(os.getenv('REQUEST_RATE', '1.0')),
+    'REQUEST_BURST': float(os.getenv('REQUEST_BURST', '2')),
+    'REQUEST_TIMEOUT': float(os.getenv('REQUEST_TIMEOUT', '10.0')),
+    'HTTP_POOL_SIZE': int(os.getenv('HTTP_POOL_SIZE', '20')),
+    'LOOKUP_BATCH_SIZE': int(os.getenv('LOOKUP_BATCH_SIZE', '10')),
+    'CACHE_MAX_SIZE': int(os.getenv('CACHE_MAX_SIZE', '100000')),
+    'CACHE_TAKEN_TTL': float(os.getenv('CACHE_TAKEN_TTL', '900')),
+    'CACHE_AVAILABLE_TTL': float(os.getenv('CACHE_AVAILABLE_TTL', '120')),
+    'RETRY_ATTEMPTS': int(os.getenv('RETRY_ATTEMPTS', '3')),
+    'RETRY_BASE_DELAY': float(os.getenv('RETRY_BASE_DELAY', '0.5')),
+    'RETRY_MAX_DELAY': float(os.getenv('RETRY_MAX_DELAY', '30')),
+    'RETRY_DEADLINE': float(os.getenv('RETRY_DEADLINE', '60')),
+    'RETRY_BUDGET': float(os.getenv('RETRY_BUDGET', '0.1')),
+    'BREAKER_THRESHOLD': float(os.getenv('BREAKER_THRESHOLD', '0.5')),
+    'BREAKER_WINDOW': int(os.getenv('BREAKER_WINDOW', '50')),
+    'BREAKER_MIN_REQUESTS': int(os.getenv('BREAKER_MIN_REQUESTS', '20')),
+    'BREAKER_COOLDOWN': float(os.getenv('BREAKER_COOLDOWN', '5')),
+    'BREAKER_MAX_COOLDOWN': float(os.getenv('BREAKER_MAX_COOLDOWN', '120')),
+    'BREAKER_PROBES': int(os.getenv('BREAKER_PROBES', '3')),
+    'USERNAME_MIN_LENGTH': int(os.getenv('USERNAME_MIN_LENGTH', '3')),
+    'USERNAME_MAX_LENGTH': int(os.getenv('USERNAME_MAX_LENGTH', '16')),
+    'USERNAME_CHARSET': os.getenv('USERNAME_CHARSET', 'A-Za-z0-9_.-'),
+    'PROFILE_API_URL': os.getenv('PROFILE_API_URL', 'https://api-cops.criticalforce.fi/api/public/profile')
+}
+
+logger = logging.getLogger(__name__)
+
+current_job: ContextVar[Optional[int]] = ContextVar('current_job', default=None)
+
+metrics = MetricsRegistry()
+api_latency = metrics.histogram('cops_api_request_seconds', 'Profile API request latency')
+scheduler_wait = metrics.histogram('cops_scheduler_wait_seconds', 'Time spent waiting for a request token')
+api_responses = metrics.counter('cops_api_responses_total', 'Profile API responses by HTTP status', 'status')
+retries = metrics.counter('cops_retries_total', 'Lookup retries by reason', 'reason')
+retries_denied = metrics.counter('cops_retries_denied_total', 'Retries skipped by the retry policy', 'reason')
+
+def generate_user_agents(n=1000):
+    browsers = ["Chrome", "Safari", "Edge", "Firefox"]
+    platforms = [
+        "Windows NT 10.0; Win64; x64",
+        "Macintosh; Intel Mac OS X 13_5",
+        "X11; Linux x86_64",
+        "iPhone; CPU iPhone OS 17_5 like Mac OS X"
+    ]
+    user_agents = []
+    for _ in range(n):
+        browser = random.choice(browsers)
+        platform = random.choice(platforms)
+        if browser == "Chrome":
+            ua = f"Mozilla/5.0 ({platform}) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/{random.randint(100,120)}.0.{random.randint(1000,6000)}.{random.randint(0,200)} Safari/537.36"
+        elif browser == "Safari":
+            ua = f"Mozilla/5.0 ({platform}) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/{random.randint(14,18)}.{random.randint(0,9)} Safari/605.1.15"
+        elif browser == "Edge":
+            ua = f"Mozilla/5.0 ({platform}) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/{random.randint(100,120)}.0.{random.randint(1000,6000)}.{random.randint(0,200)} Safari/537.36 Edg/{random.randint(100,120)}.0.{random.randint(1000,6000)}.{random.randint(0,200)}"
+        else:
+            ua = f"Mozilla/5.0 ({platform}; rv:{random.randint(90,118)}.0) Gecko/20100101 Firefox/{random.randint(90,118)}.0"
+        user_agents.append(ua)
+    return user_agents
+
+_user_agents: List[str] = []
+
+def get_user_agents() -> List[str]:
+    global _user_agents
+    if not _user_agents:
+        _user_agents = generate_user_agents(1000)
+    return _user_agents
+
+class UsernameList:
+    """Usernames packed into one UTF-8 buffer with an offset table."""
+    
+    def __init__(self):
+        self._data = bytearray()
+        self._offsets = array('Q', [0])
+    
+    def append(self, username: str):
+        self._data += username.encode('utf-8')
+        self._offsets.append(len(self._data))
+    
+    def clear(self):
+        self._data = bytearray()
+        self._offsets = array('Q', [0])
+    
+    def _get(self, i: int) -> str:
+        return self._data[self._offsets[i]:self._offsets[i + 1]].decode('utf-8')
+    
+    def __len__(self):
+        return len(self._offsets) - 1
+    
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self._get(i) for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("username index out of range")
+        return self._get(index)
+    
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self._get(i)
+    
+    def to_bytes(self) -> Tuple[bytes, bytes]:
+        return bytes(self._data), self._offsets.tobytes()
+    
+    def digest(self) -> str:
+        """Content hash of the list; the offsets are included so name boundaries count."""
+        h = hashlib.sha256(self._offsets.tobytes())
+        h.update(self._data)
+        return h.hexdigest()
+    
+    @classmethod
+    def from_bytes(cls, data: bytes, offsets: bytes) -> 'UsernameList':
+        usernames = cls()
+        usernames._data = bytearray(data)
+        usernames._offsets = array('Q')
+        usernames._offsets.frombytes(offsets)
+        return usernames
+
+class UsernameIngest:
+    """Incrementally decodes an upload (plain or gzip) into a deduplicated UsernameList.
+    
+    Gzip input is inflated at most SLICE bytes at a time, and feed() raises
+    ValueError once the text passes `max_bytes` or `max_lines`, so a small
+    compressed upload can't expand into unbounded memory or CPU time.
+    """
+    
+    SLICE = 1 << 20
+    
+    def __init__(self, max_usernames: int = 5000000, max_bytes: int = 200000000, max_lines: int = 10000000):
+        self.max_usernames = max_usernames
+        self.max_bytes = max_bytes
+        self.max_lines = max_lines
+        self.usernames = UsernameList()
+        self.bytes = 0
+        self.lines = 0
+        self.duplicates = 0
+        # Hashes of casefolded names; far smaller than keeping every string
+        self._seen: Set[int] = set()
+        self._decoder = codecs.getincrementaldecoder('utf-8')(errors='ignore')
+        self._decompressor = None
+        self._started = False
+        self._head = b""
+        self._pending = ""
+    
+    def feed(self, chunk: bytes):
+        if not self._started:
+            # Chunks may be arbitrarily small; wait for the whole gzip magic
+            self._head += chunk
+            if len(self._head) < 2:
+                return
+            chunk, self._head = self._head, b""
+            self._started = True
+            if chunk[:2] == b"\x1f\x8b":
+                self._decompressor = zlib.decompressobj(zlib.MAX_WBITS | 16)
+        if self._decompressor is None:
+            self._feed_bytes(chunk)
+            return
+        while chunk:
+            self._feed_bytes(self._decompressor.decompress(chunk, self.SLICE))
+            if self._decompressor.eof:
+                # Concatenated members (cat a.gz b.gz) carry on after each one ends
+                chunk = self._decompressor.unused_data
+                self._decompressor = zlib.decompressobj(zlib.MAX_WBITS | 16)
+            else:
+                chunk = self._decompressor.unconsumed_tail
+    
+    def _feed_bytes(self, data: bytes):
+        self.bytes += len(data)
+        if self.bytes > self.max_bytes:
+            raise ValueError(f"more than {self.max_bytes} bytes of text")
+        self._feed_text(self._decoder.decode(data))
+    
+    def close(self) -> UsernameList:
+        if not self._started:
+            self._started = True
+            self._feed_bytes(self._head)
+        if self._decompressor is not None:
+            self._feed_bytes(self._decompressor.flush())
+        self._feed_text(self._decoder.decode(b"", final=True))
+        if self._pending:
+            self._add(self._pending)
+            self._pending = ""
+        self._seen.clear()
+        return self.usernames
+    
+    def _feed_text(self, text: str):
+        if not text:
+            return
+        lines = (self._pending + text).splitlines(True)
+        last = lines[-1]
+        # Hold back a trailing line that hasn't seen its terminator yet
+        if last.splitlines()[0] == last:
+            self._pending = lines.pop()
+            if len(self._pending) > 1024:
+                raise ValueError("line longer than 1024 characters")
+        else:
+            self._pending = ""
+        for line in lines:
+            self._add(line)
+    
+    def _add(self, line: str):
+        username = line.strip().lstrip("\ufeff")
+        if not username:
+            return
+        self.lines += 1
+        if self.lines > self.max_lines:
+            raise ValueError(f"more than {self.max_lines} lines")
+        key = hash(username.casefold())
+        if key in self._seen:
+            self.duplicates += 1
+            return
+        if len(self.usernames) >= self.max_usernames:
+            raise ValueError(f"more than {self.max_usernames} unique usernames")
+        self._seen.add(key)
+        self.usernames.append(username)
+
+class UsernameRules:
+    """Compiled check for names the game could ever accept."""
+    
+    def __init__(self, min_length: int = 3, max_length: int = 16, charset: str = "A-Za-z0-9_.-"):
+        self.min_length = min_length
+        self.max_length = max_length
+        self.pattern = re.compile(f"[{charset}]{{{min_length},{max_length}}}")
+    
+    def valid(self, username: str) -> bool:
+        return self.pattern.fullmatch(username) is not None
+
+BLOOM_MAGIC = b"NCBLOOM1"
+# magic, bit count, hash count, names added, created (unix time)
+BLOOM_HEADER = struct.Struct("<8sQQQd")
+
+class BloomFilter:
+    """Bloom filter over case-folded names, stored as a raw bit array.
+    
+    Positions come from one blake2b digest per name (double hashing), so
+    a saved filter stays valid across processes and restarts.
+    """
+    
+    def __init__(self, capacity: int = 5000000, error_rate: float = 0.01, created: float = 0.0):
+        capacity = max(1, capacity)
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.count = 0
+        self.created = created
+        self.bits = bytearray((self.size + 7) // 8)
+    
+    def _positions(self, username: str):
+        h1, h2 = struct.unpack("<QQ", hashlib.blake2b(username.casefold().encode('utf-8'), digest_size=16).digest())
+        return [(h1 + i * h2) % self.size for i in range(self.hashes)]
+    
+    def add(self, username: str) -> bool:
+        """Add a name; False if it (or a false positive) was already present."""
+        added = False
+        for pos in self._positions(username):
+            byte, bit = pos >> 3, 1 << (pos & 7)
+            if not self.bits[byte] & bit:
+                self.bits[byte] |= bit
+                added = True
+        if added:
+            self.count += 1
+        return added
+    
+    def __contains__(self, username: str) -> bool:
+        bits = self.bits
+        return all(bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(username))
+    
+    def write(self, f):
+        f.write(BLOOM_HEADER.pack(BLOOM_MAGIC, self.size, self.hashes, self.count, self.created))
+        f.write(bytes(self.bits))
+    
+    @classmethod
+    def read(cls, f) -> Optional['BloomFilter']:
+        magic, size, hashes, count, created = BLOOM_HEADER.unpack(f.read(BLOOM_HEADER.size))
+        bits = f.read((size + 7) // 8)
+        if magic != BLOOM_MAGIC or len(bits) != (size + 7) // 8:
+            return None
+        bloom = cls(1, created=created)
+        bloom.size, bloom.hashes, bloom.count, bloom.bits = size, hashes, count, bytearray(bits)
+        return bloom
+
+TAKEN_MAGIC = b"NCTAKEN1"
+# magic, generation count; each generation follows as a BloomFilter
+TAKEN_HEADER = struct.Struct("<8sI")
+
+class AgingBloomFilter:
+    """Names seen within roughly the last `window` seconds.
+    
+    Names go into the newest of up to `generations` BloomFilters, each
+    started window / generations seconds after the previous one or once
+    the newest one is full. Lookups check every generation, and rotate()
+    drops those whose newest possible name is older than the window. A name
+    is remembered for at least `window` seconds and at most one generation
+    longer, unless more than `capacity` names arrive within the window: then
+    the oldest generation is dropped early and its names get checked again.
+    """
+    
+    def __init__(self, capacity: int = 5000000, window: float = 86400.0, generations: int = 4,
+                 error_rate: float = 0.01):
+        self.generations = max(1, generations)
+        self.capacity = max(1, capacity // self.generations)
+        self.window = window
+        self.span = window / self.generations
+        # Lookups check up to generations + 1 filters, so each gets a share of the error rate
+        self.error_rate = error_rate / (self.generations + 1)
+        self.dirty = False
+        # Newest first. Replaced, never mutated, so a reader in another thread sees a consistent list
+        self.filters: List[BloomFilter] = []
+    
+    @property
+    def count(self) -> int:
+        return sum(bloom.count for bloom in self.filters)
+    
+    def rotate(self, now: Optional[float] = None):
+        now = time.time() if now is None else now
+        kept = [bloom for bloom in self.filters if bloom.created + self.span > now - self.window]
+        if len(kept) != len(self.filters):
+            self.filters = kept
+            self.dirty = True
+    
+    def add(self, username: str):
+        now = time.time()
+        if (not self.filters or now - self.filters[0].created >= self.span
+                or self.filters[0].count >= self.capacity):
+            self.rotate(now)
+            # A full generation would push the false-positive rate past error_rate
+            self.filters = [BloomFilter(self.capacity, self.error_rate, now)] + self.filters[:self.generations]
+        if self.filters[0].add(username):
+            self.dirty = True
+    
+    def __contains__(self, username: str) -> bool:
+        return any(username in bloom for bloom in self.filters)
+    
+    def save(self, path: str):
+        self.dirty = False
+        filters = self.filters
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(TAKEN_HEADER.pack(TAKEN_MAGIC, len(filters)))
+            for bloom in filters:
+                bloom.write(f)
+        os.replace(tmp_path, path)
+    
+    @classmethod
+    def load(cls, path: str, capacity: int = 5000000, window: float = 86400.0, generations: int = 4,
+             error_rate: float = 0.01) -> 'AgingBloomFilter':
+        aging = cls(capacity, window, generations, error_rate)
+        try:
+            with open(path, 'rb') as f:
+                magic, count = TAKEN_HEADER.unpack(f.read(TAKEN_HEADER.size))
+                filters = [BloomFilter.read(f) for _ in range(count)] if magic == TAKEN_MAGIC else [None]
+        except FileNotFoundError:
+            return aging
+        except (OSError, struct.error):
+            filters = [None]
+        if None in filters:
+            logger.warning(f"Ignoring invalid taken-name filter at {path}")
+            return aging
+        aging.filters = filters
+        aging.rotate()
+        return aging
+
+SKIP_INVALID, SKIP_DUPLICATE, SKIP_TAKEN = 1, 2, 3
+
+class PreflightStats(NamedTuple):
+    queued: int
+    invalid: int
+    duplicates: int
+    known_taken: int
+
+def preflight(usernames, rules: UsernameRules, taken: Optional[AgingBloomFilter] = None) -> Tuple[bytearray, PreflightStats]:
+    """Mark names that can't produce a hit before any request is spent on them.
+    
+    Returns one byte per name (0 to check, otherwise the SKIP_* step that
+    dropped it) and the count for each step.
+    """
+    skip = bytearray(len(usernames))
+    counts = [0, 0, 0, 0]
+    valid = rules.pattern.fullmatch
+    seen: Set[int] = set()
+    for i, username in enumerate(usernames):
+        if valid(username) is None:
+            step = SKIP_INVALID
+        else:
+            key = hash(username.casefold())
+            if key in seen:
+                step = SKIP_DUPLICATE
+            else:
+                seen.add(key)
+                step = SKIP_TAKEN if taken is not None and username in taken else 0
+        skip[i] = step
+        counts[step] += 1
+    return skip, PreflightStats(counts[0], counts[SKIP_INVALID], counts[SKIP_DUPLICATE], counts[SKIP_TAKEN])
+
+class CircuitBreaker:
+    """Stops all requests when too many recent ones fail upstream.
+    
+    Once the failure ratio over the last `window` requests reaches
+    `threshold`, the breaker opens for a cooldown. It then lets `probes`
+    requests through; if they all succeed it closes, otherwise it opens
+    again with a doubled cooldown.
+    """
+    
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+    
+    def __init__(self, threshold: float = 0.5, window: int = 50, min_requests: int = 20,
+                 cooldown: float = 5.0, max_cooldown: float = 120.0, probes: int = 3):
+        self.threshold = threshold
+        self.min_requests = min_requests
+        self.base_cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.probes = max(1, probes)
+        self.state = self.CLOSED
+        self.trips = 0
+        self._outcomes: deque = deque(maxlen=max(1, window))
+        self._cooldown = cooldown
+        self._open_until = 0.0
+        self._probes_sent = 0
+        self._probes_ok = 0
+    
+    def delay(self, now: float) -> float:
+        """Seconds before the next request may be sent."""
+        if self.state == self.OPEN:
+            if now < self._open_until:
+                return self._open_until - now
+            self.state = self.HALF_OPEN
+            self._probes_sent = self._probes_ok = 0
+            self._open_until = now + self._cooldown
+            logger.info(f"Circuit half-open, sending {self.probes} probe requests")
+        if self.state == self.HALF_OPEN and self._probes_sent >= self.probes:
+            if now < self._open_until:
+                return self._open_until - now
+            # Probes that never reported (cancelled lookups) don't hold the breaker shut
+            self._probes_sent = self._probes_ok
+            self._open_until = now + self._cooldown
+        return 0.0
+    
+    def admit(self) -> bool:
+        """Count a request that is about to go out; True if it is a probe."""
+        if self.state == self.HALF_OPEN:
+            self._probes_sent += 1
+            return True
+        return False
+    
+    def record(self, ok: bool, probe: bool, now: float) -> bool:
+        """Record an outcome; True if the breaker changed state."""
+        if probe:
+            if self.state != self.HALF_OPEN:
+                return False
+            if not ok:
+                self._cooldown = min(self.max_cooldown, self._cooldown * 2)
+                self._trip(now)
+                return True
+            self._probes_ok += 1
+            if self._probes_ok < self.probes:
+                return False
+            self.state = self.CLOSED
+            self._cooldown = self.base_cooldown
+            self._outcomes.clear()
+            logger.info("Circuit closed, resuming at full rate")
+            return True
+        if self.state != self.CLOSED:
+            return False
+        self._outcomes.append(ok)
+        if len(self._outcomes) < self.min_requests:
+            return False
+        failures = self._outcomes.count(False)
+        if failures / len(self._outcomes) < self.threshold:
+            return False
+        self._trip(now)
+        return True
+    
+    def _trip(self, now: float):
+        self.state = self.OPEN
+        self.trips += 1
+        self._open_until = now + self._cooldown
+        logger.warning(f"Circuit open after upstream failures, pausing all requests for {self._cooldown:.1f}s")
+
+class RequestScheduler:
+    def __init__(self, rate: float = 1.0, burst: float = 2.0, min_rate: float = 0.05,
+                 breaker: Optional[CircuitBreaker] = None):
+        self.breaker = breaker
+        self.burst = burst
+        self.min_rate = min_rate
+        self.set_rate(rate)
+        self._tokens = burst
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._queues: Dict[Optional[int], deque] = {}
+        self._weights: Dict[Optional[int], int] = {}
+        self._pass: Dict[Optional[int], float] = {}
+        self._vtime = 0.0
+        self._dispatcher: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+    
+    def set_rate(self, rate: float):
+        # The dispatcher divides by the rate; zero or below would never hand out a token
+        self.max_rate = self.rate = max(self.min_rate, rate)
+    
+    def register(self, job, weight: int = 1):
+        self._weights[job] = max(1, weight)
+    
+    def unregister(self, job):
+        self._weights.pop(job, None)
+        self._pass.pop(job, None)
+    
+    async def acquire(self, job=None) -> bool:
+        """Wait for a request token; returns True if the request is a circuit-breaker probe."""
+        future = asyncio.get_running_loop().create_future()
+        if job not in self._queues:
+            # Idle jobs don't bank credit while they aren't asking
+            self._pass[job] = max(self._pass.get(job, 0.0), self._vtime)
+            self._queues[job] = deque()
+        self._queues[job].append(future)
+        if self._dispatcher is None or self._dispatcher.done():
+            self._wakeup = asyncio.Event()
+            self._dispatcher = asyncio.create_task(self._dispatch())
+        with scheduler_wait.time():
+            return await future
+    
+    def throttle(self, retry_after: float):
+        # 429: stop everyone until Retry-After and halve the sustained rate
+        self._paused_until = max(self._paused_until, time.monotonic() + retry_after)
+        self._tokens = 0.0
+        self.rate = max(self.min_rate, self.rate / 2)
+        logger.warning(f"Rate limited by API, pausing {retry_after:.1f}s, rate now {self.rate:.2f}/s")
+        if self._wakeup is not None:
+            self._wakeup.set()
+    
+    def record(self, ok: bool, probe: bool = False):
+        if self.breaker is not None and self.breaker.record(ok, probe, time.monotonic()):
+            if self._wakeup is not None:
+                self._wakeup.set()
+    
+    def relax(self):
+        if self.rate < self.max_rate:
+            self.rate = min(self.max_rate, self.rate + self.max_rate / 50)
+    
+    def pending(self) -> int:
+        return sum(len(q) for q in self._queues.values())
+    
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+    
+    async def _sleep(self, delay: float):
+        # Wakes early if throttle() moves the pause window
+        self._wakeup.clear()
+        try:
+            await asyncio.wait_for(self._wakeup.wait(), delay)
+        except asyncio.TimeoutError:
+            pass
+    
+    async def _dispatch(self):
+        while self._queues:
+            now = time.monotonic()
+            if now < self._paused_until:
+                await self._sleep(self._paused_until - now)
+                self._updated = time.monotonic()
+                continue
+            if self.breaker is not None:
+                wait = self.breaker.delay(now)
+                if wait > 0:
+                    await self._sleep(wait)
+                    continue
+            self._refill()
+            if self._tokens < 1:
+                await self._sleep((1 - self._tokens) / self.rate)
+                continue
+            
+            # Weighted fair share (stride scheduling): the waiting job with
+            # the lowest virtual pass goes next and advances by 1/weight.
+            job = min(self._queues, key=lambda j: self._pass.get(j, 0.0))
+            queue = self._queues[job]
+            while queue and queue[0].done():
+                queue.popleft()
+            if queue:
+                queue.popleft().set_result(self.breaker.admit() if self.breaker is not None else False)
+                self._tokens -= 1
+                self._vtime = self._pass.get(job, 0.0)
+                self._pass[job] = self._vtime + 1 / self._weights.get(job, 1)
+            if not queue:
+                del self._queues[job]
+
+def _retry_after_seconds(value: Optional[str], default: float = 5.0) -> float:
+    if not value:
+        return default
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return default
+
+class RetryPolicy:
+    """Shared retry rules for every lookup.
+    
+    Backoff is exponential with jitter. A retry is skipped if it would
+    run past the lookup's deadline, or if the retry budget is spent:
+    each request adds `budget_ratio` of a token and each retry costs
+    one, so retries stay near that fraction of all requests.
+    """
+    
+    def __init__(self, attempts: int = 3, base_delay: float = 0.5, max_delay: float = 30.0,
+                 deadline: float = 60.0, budget_ratio: float = 0.1, max_tokens: float = 20.0):
+        self.attempts = max(1, attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.deadline = deadline
+        self.budget_ratio = budget_ratio
+        self.max_tokens = max_tokens
+        self.tokens = max_tokens
+    
+    def on_request(self):
+        self.tokens = min(self.max_tokens, self.tokens + self.budget_ratio)
+    
+    def backoff(self, attempt: int, base: Optional[float] = None) -> float:
+        cap = min(self.max_delay, (base or self.base_delay) * 2 ** attempt)
+        return cap / 2 + random.uniform(0, cap / 2)
+    
+    async def allow(self, attempt: int, elapsed: float, delay: float = 0.0) -> bool:
+        if attempt + 1 >= self.attempts:
+            return False
+        if elapsed + delay > self.deadline:
+            retries_denied.inc("deadline")
+            return False
+        return await self.spend()
+    
+    async def spend(self) -> bool:
+        """Take one retry token from the budget."""
+        if self.tokens < 1:
+            retries_denied.inc("budget")
+            return False
+        self.tokens -= 1
+        return True
+    
+    async def retry(self, attempt: int, started: float, reason: str, base: Optional[float] = None) -> bool:
+        """Sleep before attempt `attempt + 1`; False if the lookup should give up instead."""
+        delay = self.backoff(attempt, base)
+        if not await self.allow(attempt, time.perf_counter() - started, delay):
+            return False
+        retries.inc(reason)
+        await asyncio.sleep(delay)
+        return True
+
+def _upstream_failure(status: int) -> bool:
+    # The profile API answers 500 for unknown names, so only 403 and other 5xx count
+    return status == 403 or status > 500
+
+class Status(IntEnum):
+    AVAILABLE = 1
+    TAKEN = 2
+    ERROR = 3
+    TIMEOUT = 4
+    BLOCKED = 5
+    SKIPPED = 6
+
+class CheckResult(NamedTuple):
+    """Outcome of one lookup. `attempts` is 0 when the answer came from the cache."""
+    
+    username: str
+    status: Status
+    http_status: int = 0
+    attempts: int = 0
+    latency: float = 0.0
+    detail: str = ""
+    
+    @property
+    def available(self) -> bool:
+        return self.status == Status.AVAILABLE
+    
+    def __str__(self) -> str:
+        if self.status == Status.AVAILABLE:
+            return f"{self.username} ✓"
+        if self.status == Status.TAKEN:
+            return f"{self.username} ✗"
+        if self.status == Status.SKIPPED:
+            return "Empty username skipped"
+        return f"{self.username} - {self.detail}"
+    
+    @classmethod
+    def from_row(cls, row) -> 'CheckResult':
+        username, status, http_status, attempts, latency, detail = row
+        return cls(username, Status(status), http_status, attempts, latency, detail)
+
+REPORT_FIELDS = ("username", "status", "http_status", "attempts", "latency_ms", "result")
+
+def report_row(result: CheckResult) -> list:
+    return [result.username, result.status.name.lower(), result.http_status, result.attempts,
+            round(result.latency * 1000, 1), str(result)]
+
+class ProfileApiClient:
+    def __init__(self, pool_size: int = 20, timeout: float = 10.0):
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self._session: Optional[aiohttp.ClientSession] = None
+    
+    def _get_session(self) -> aiohttp.ClientSession:
+        # Created lazily so the session binds to the running event loop
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=self.pool_size, keepalive_timeout=30)
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=self.timeout)
+            )
+        return self._session
+    
+    async def get_profiles(self, usernames: str):
+        session = self._get_session()
+        headers = {"User-Agent": random.choice(get_user_agents())}
+        probe = await request_scheduler.acquire(current_job.get())
+        retry_policy.on_request()
+        started = time.perf_counter()
+        try:
+            async with session.get(CONFIG['PROFILE_API_URL'], params={"usernames": usernames}, headers=headers) as response:
+                body = await response.read()
+        except asyncio.TimeoutError:
+            api_responses.inc("timeout")
+            request_scheduler.record(False, probe)
+            raise
+        except aiohttp.ClientError:
+            api_responses.inc("error")
+            request_scheduler.record(False, probe)
+            raise
+        finally:
+            api_latency.observe(time.perf_counter() - started)
+        api_responses.inc(response.status)
+        request_scheduler.record(not _upstream_failure(response.status), probe)
+        if response.status == 429:
+            request_scheduler.throttle(_retry_after_seconds(response.headers.get("Retry-After")))
+        else:
+            request_scheduler.relax()
+        return response.status, body
+    
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+class AvailabilityCache:
+    def __init__(self, max_size: int = 100000, taken_ttl: float = 900.0, available_ttl: float = 120.0):
+        self.max_size = max_size
+        self.taken_ttl = taken_ttl
+        self.available_ttl = available_ttl
+        self.hits = 0
+        self.misses = 0
+        self.shared = 0
+        # Values are the Status alone so a hit can be rendered with whatever
+        # casing the caller used.
+        self._entries: OrderedDict = OrderedDict()
+        self._inflight: Dict[str, asyncio.Future] = {}
+    
+    def get(self, key: str) -> Optional[Status]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        status, expires_at = entry
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return status
+    
+    def join(self, key: str) -> Optional[asyncio.Future]:
+        future = self._inflight.get(key)
+        if future is not None:
+            self.shared += 1
+        return future
+    
+    def begin(self, key: str) -> asyncio.Future:
+        self.misses += 1
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        return future
+    
+    def finish(self, key: str, status: Optional[Status]):
+        future = self._inflight.pop(key, None)
+        if status == Status.TAKEN:
+            self._put(key, status, self.taken_ttl)
+        elif status == Status.AVAILABLE:
+            self._put(key, status, self.available_ttl)
+        if future is not None and not future.done():
+            future.set_result(status)
+    
+    def _put(self, key: str, status: Status, ttl: float):
+        self._entries[key] = (status, time.monotonic() + ttl)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+    
+    def __len__(self):
+        return len(self._entries)
+
+username_rules = UsernameRules(CONFIG['USERNAME_MIN_LENGTH'], CONFIG['USERNAME_MAX_LENGTH'], CONFIG['USERNAME_CHARSET'])
+circuit_breaker = CircuitBreaker(CONFIG['BREAKER_THRESHOLD'], CONFIG['BREAKER_WINDOW'], CONFIG['BREAKER_MIN_REQUESTS'],
+                                 CONFIG['BREAKER_COOLDOWN'], CONFIG['BREAKER_MAX_COOLDOWN'], CONFIG['BREAKER_PROBES'])
+retry_policy = RetryPolicy(CONFIG['RETRY_ATTEMPTS'], CONFIG['RETRY_BASE_DELAY'], CONFIG['RETRY_MAX_DELAY'],
+                           CONFIG['RETRY_DEADLINE'], CONFIG['RETRY_BUDGET'])
+request_scheduler = RequestScheduler(CONFIG['REQUEST_RATE'], CONFIG['REQUEST_BURST'], breaker=circuit_breaker)
+
+metrics.gauge('cops_circuit_state', 'Circuit breaker state (1 marks the current state)',
+              lambda: [({'state': circuit_breaker.state}, 1)])
+metrics.gauge('cops_retry_budget_tokens', 'Retries the shared budget can still pay for',
+              lambda: [({}, round(retry_policy.tokens, 2))])
+api_client = ProfileApiClient(CONFIG['HTTP_POOL_SIZE'], CONFIG['REQUEST_TIMEOUT'])
+availability_cache = AvailabilityCache(CONFIG['CACHE_MAX_SIZE'], CONFIG['CACHE_TAKEN_TTL'], CONFIG['CACHE_AVAILABLE_TTL'])
+
+async def _fetch_username_availability(username: str) -> CheckResult:
+    username = username.strip()
+    if not username:
+        return CheckResult(username, Status.SKIPPED)
+    
+    started = time.perf_counter()
+    status_code = 0
+    attempt = 0
+    
+    def result(status: Status, detail: str = "") -> CheckResult:
+        return CheckResult(username, status, status_code, attempt + 1, time.perf_counter() - started, detail)
+    
+    while True:
+        # Retry base delay; None uses the policy default
+        base = None
+        try:
+            status_code, body = await api_client.get_profiles(username)
+            logger.debug(f"Response status for {username}: {status_code}")
+            
+            if status_code == 200:
+                try:
+                    data = json.loads(body)
+                    if ("error" in data and data["error"] == 53) or (isinstance(data, list) and len(data) == 0):
+                        return result(Status.AVAILABLE)
+                    else:
+                        return result(Status.TAKEN)
+                except (json.JSONDecodeError, ValueError) as e:
+                    logger.warning(f"JSON parsing error for {username}: {e}")
+                    failure, detail, reason = Status.ERROR, "JSON parse error", "json_error"
+            elif status_code == 500:
+                return result(Status.AVAILABLE)
+            elif status_code == 403:
+                logger.warning(f"403 Forbidden for {username} (attempt {attempt + 1})")
+                failure, detail, reason = Status.BLOCKED, "blocked (403)", "forbidden"
+                base = 2.0
+            else:
+                logger.warning(f"Unexpected HTTP {status_code} for {username}")
+                failure, detail, reason = Status.ERROR, f"HTTP {status_code}", f"http_{status_code}"
+                    
+        except asyncio.TimeoutError:
+            logger.warning(f"Timeout for {username} (attempt {attempt + 1})")
+            status_code = 0
+            failure, detail, reason = Status.TIMEOUT, "timeout", "timeout"
+        except aiohttp.ClientError as e:
+            logger.warning(f"Request error for {username}: {e}")
+            status_code = 0
+            failure, detail, reason = Status.ERROR, "request error", "request_error"
+        
+        if not await retry_policy.retry(attempt, started, reason, base):
+            return result(failure, detail)
+        attempt += 1
+
+def _profile_name(profile) -> Optional[str]:
+    if not isinstance(profile, dict):
+        return None
+    basic_info = profile.get("basicInfo")
+    if isinstance(basic_info, dict) and isinstance(basic_info.get("name"), str):
+        return basic_info["name"]
+    name = profile.get("name")
+    return name if isinstance(name, str) else None
+
+async def fetch_usernames_batch(names: List[str]) -> List[CheckResult]:
+    """Look names up with one batched request, bypassing the availability cache."""
+    lookup = [u for u in names if u]
+    
+    if len(lookup) > 1 and not any("," in u for u in lookup):
+        started = time.perf_counter()
+        status_code = 0
+        try:
+            status_code, body = await api_client.get_profiles(",".join(lookup))
+            if status_code == 200:
+                data = json.loads(body)
+                # Error bodies (including error 53) can't say which names are free
+                if isinstance(data, list):
+                    taken = {(_profile_name(p) or "").lower() for p in data}
+                    # Every returned profile must map back to a requested name,
+                    # otherwise we can't tell which names are free.
+                    if taken <= {u.lower() for u in lookup}:
+                        latency = time.perf_counter() - started
+                        return [
+                            CheckResult(u, Status.SKIPPED) if not u else
+                            CheckResult(u, Status.TAKEN if u.lower() in taken else Status.AVAILABLE, 200, 1, latency)
+                            for u in names
+                        ]
+                logger.warning(f"Batch lookup of {len(lookup)} names returned an unexpected response")
+            else:
+                logger.warning(f"Batch lookup of {len(lookup)} names returned HTTP {status_code}")
+        except asyncio.TimeoutError:
+            logger.warning(f"Timeout on batch lookup of {len(lookup)} names")
+        except (aiohttp.ClientError, ValueError) as e:
+            logger.warning(f"Batch lookup error: {e}")
+        
+        # Falling back multiplies requests by the batch size; skip it when the
+        # upstream is failing and the retry budget can't cover another attempt
+        if (status_code == 0 or _upstream_failure(status_code)) and not await retry_policy.allow(0, time.perf_counter() - started):
+            latency = time.perf_counter() - started
+            return [
+                CheckResult(u, Status.SKIPPED) if not u else
+                CheckResult(u, Status.ERROR, status_code, 1, latency, "batch lookup failed")
+                for u in names
+            ]
+        logger.info(f"Falling back to single checks for {len(lookup)} names")
+        retries.inc("batch_fallback")
+    
+    return [await _fetch_username_availability(u) for u in names]
+
+async def check_usernames_batch(usernames: List[str], use_cache: bool = True,
+                                fetch: Optional[Callable[[List[str]], Awaitable[List[CheckResult]]]] = None
+                                ) -> List[CheckResult]:
+    """Look names up through the availability cache.
+    
+    With `use_cache=False` cached answers are ignored, but lookups already
+    in flight are still shared and fresh results still refresh the cache.
+    `fetch` looks up the misses (fetch_usernames_batch by default).
+    """
+    names = [u.strip() for u in usernames]
+    results: List[Optional[CheckResult]] = [None] * len(names)
+    waiting = []
+    to_fetch = []
+    
+    for i, username in enumerate(names):
+        if not username:
+            results[i] = CheckResult(username, Status.SKIPPED)
+            continue
+        key = username.lower()
+        status = availability_cache.get(key) if use_cache else None
+        if status is not None:
+            results[i] = CheckResult(username, status, 200)
+            continue
+        future = availability_cache.join(key)
+        if future is not None:
+            waiting.append((i, future))
+        else:
+            availability_cache.begin(key)
+            to_fetch.append(i)
+    
+    try:
+        if to_fetch:
+            fetched = await (fetch or fetch_usernames_batch)([names[i] for i in to_fetch])
+            for i, result in zip(to_fetch, fetched):
+                results[i] = result
+                availability_cache.finish(names[i].lower(), result.status)
+    finally:
+        # Release anyone waiting on us if the lookup was cancelled or raised
+        for i in to_fetch:
+            if results[i] is None:
+                availability_cache.finish(names[i].lower(), None)
+    
+    for i, future in waiting:
+        status = await future
+        if status in (Status.AVAILABLE, Status.TAKEN):
+            results[i] = CheckResult(names[i], status, 200)
+        else:
+            results[i] = await check_username_availability(names[i])
+    
+    return results
+
+async def check_username_availability(username: str) -> CheckResult:
+    return (await check_usernames_batch([username]))[0]
+
+async def iter_results(usernames, concurrency: int = 4, batch_size: Optional[int] = None) -> AsyncIterator[CheckResult]:
+    """Check names with up to `concurrency` lookups in flight, yielding results as batches finish."""
+    batch_size = max(1, batch_size or CONFIG['LOOKUP_BATCH_SIZE'])
+    names = iter(usernames)
+    pending: Set[asyncio.Task] = set()
+    exhausted = False
+    try:
+        while True:
+            while not exhausted and len(pending) < max(1, concurrency):
+                batch = [u for _, u in zip(range(batch_size), names)]
+                if not batch:
+                    exhausted = True
+                    break
+                pending.add(asyncio.create_task(check_usernames_batch(batch)))
+            if not pending:
+                return
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                for result in task.result():
+                    yield result
+    finally:
+        for task in pending:
+            task.cancel()
+
+async def close():
+    await api_client.close()
+
+def read_usernames(stream, max_usernames: int) -> UsernameIngest:
+    ingest = UsernameIngest(max_usernames, CONFIG['MAX_INPUT_BYTES'], CONFIG['MAX_INPUT_LINES'])
+    for chunk in iter(lambda: stream.read(65536), b""):
+        ingest.feed(chunk)
+    ingest.close()
+    return ingest
+
+async def run_cli(args: argparse.Namespace) -> int:
+    if args.input == "-":
+        ingest = read_usernames(sys.stdin.buffer, CONFIG['MAX_USERNAMES'])
+    else:
+        with open(args.input, 'rb') as f:
+            ingest = read_usernames(f, CONFIG['MAX_USERNAMES'])
+    skip, stats = preflight(ingest.usernames, username_rules)
+    usernames = (u for u, step in zip(ingest.usernames, skip) if not step)
+    logger.info(f"Checking {stats.queued} usernames ({ingest.duplicates + stats.duplicates} duplicates "
+                f"and {stats.invalid} invalid names dropped)")
+    
+    out = sys.stdout
+    writer = None
+    if args.format == "csv":
+        writer = csv.writer(out)
+        writer.writerow(REPORT_FIELDS)
+    
+    counts: Dict[str, int] = {}
+    try:
+        async for result in iter_results(usernames, args.concurrency, args.batch_size):
+            row = report_row(result)
+            counts[row[1]] = counts.get(row[1], 0) + 1
+            if args.available_only and not result.available:
+                continue
+            if writer is not None:
+                writer.writerow(row)
+            else:
+                out.write(json.dumps(dict(zip(REPORT_FIELDS, row)), ensure_ascii=False) + "\n")
+            out.flush()
+    finally:
+        await close()
+    
+    logger.info("Done: " + ", ".join(f"{n} {status}" for status, n in sorted(counts.items())))
+    return 0
+
+def _positive_float(value: str) -> float:
+    number = float(value)
+    if not number > 0:
+        raise argparse.ArgumentTypeError(f"must be greater than 0, got {value}")
+    return number
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Check Critical Ops username availability without the Discord bot")
+    parser.add_argument("input", nargs="?", default="-", help="File of usernames, one per line (.gz accepted); '-' for stdin")
+    parser.add_argument("--format", choices=["jsonl", "csv"], default="jsonl")
+    parser.add_argument("--concurrency", type=int, default=4, help="Lookups in flight at once")
+    parser.add_argument("--batch-size", type=int, default=None, help="Names per request (default LOOKUP_BATCH_SIZE)")
+    parser.add_argument("--rate", type=_positive_float, default=None, help="Request rate limit per second (default REQUEST_RATE)")
+    parser.add_argument("--available-only", action="store_true", help="Only output available names")
+    args = parser.parse_args(argv)
+    
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s', stream=sys.stderr)
+    if args.rate is not None:
+        request_scheduler.set_rate(args.rate)
+    try:
+        return asyncio.run(run_cli(args))
+    except KeyboardInterrupt:
+        return 130
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,233 @@
+import asyncio
+import sys
+import threading
+import time
+from collections import Counter as FrameCounter
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from aiohttp import web
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels.items()) + "}"
+
+class Histogram:
+    def __init__(self, name: str, help_text: str, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.count += 1
+        self.sum += value
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                return
+        self.counts[-1] += 1
+
+    def merge(self, counts: List[int], count: int, total: float):
+        for i, n in enumerate(counts):
+            self.counts[i] += n
+        self.count += count
+        self.sum += total
+
+    def reset(self):
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def time(self):
+        return _Timer(self)
+
+    def quantile(self, q: float) -> float:
+        """Estimate a quantile by interpolating inside the bucket that holds it."""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        lower = 0.0
+        for bound, n in zip(self.buckets, self.counts):
+            if n and seen + n >= rank:
+                return lower + (bound - lower) * (rank - seen) / n
+            seen += n
+            lower = bound
+        return self.buckets[-1]
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        cumulative = 0
+        for bound, n in zip(self.buckets, self.counts):
+            cumulative += n
+            lines.append(f'{self.name}_bucket{{le="{bound}"}} {cumulative}')
+        lines.append(f'{self.name}_bucket{{le="+Inf"}} {self.count}')
+        lines.append(f"{self.name}_sum {self.sum}")
+        lines.append(f"{self.name}_count {self.count}")
+        return lines
+
+class _Timer:
+    def __init__(self, histogram: Histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.started)
+        return False
+
+class Counter:
+    def __init__(self, name: str, help_text: str, label: str):
+        self.name = name
+        self.help_text = help_text
+        self.label = label
+        self.values: Dict[str, int] = {}
+
+    def inc(self, label_value, amount: int = 1):
+        key = str(label_value)
+        self.values[key] = self.values.get(key, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        for value, count in sorted(self.values.items()):
+            lines.append(f"{self.name}{_format_labels({self.label: value})} {count}")
+        return lines
+
+class Gauge:
+    """Gauge whose samples are read from a callback at scrape time."""
+
+    def __init__(self, name: str, help_text: str, collect: Callable[[], Iterable[Tuple[Dict[str, str], float]]]):
+        self.name = name
+        self.help_text = help_text
+        self.collect = collect
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} gauge"]
+        for labels, value in self.collect():
+            lines.append(f"{self.name}{_format_labels(labels)} {value}")
+        return lines
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = []
+
+    def histogram(self, name: str, help_text: str, buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+        metric = Histogram(name, help_text, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name: str, help_text: str, label: str) -> Counter:
+        metric = Counter(name, help_text, label)
+        self._metrics.append(metric)
+        return metric
+
+    def gauge(self, name: str, help_text: str, collect) -> Gauge:
+        metric = Gauge(name, help_text, collect)
+        self._metrics.append(metric)
+        return metric
+
+    def collect_samples(self) -> dict:
+        """Return and reset every histogram and counter, for shipping to another process."""
+        samples = {"histograms": {}, "counters": {}}
+        for metric in self._metrics:
+            if isinstance(metric, Histogram) and metric.count:
+                samples["histograms"][metric.name] = [metric.counts, metric.count, metric.sum]
+                metric.reset()
+            elif isinstance(metric, Counter) and metric.values:
+                samples["counters"][metric.name] = metric.values
+                metric.values = {}
+        return samples if samples["histograms"] or samples["counters"] else {}
+
+    def merge_samples(self, samples: dict):
+        by_name = {metric.name: metric for metric in self._metrics}
+        for name, (counts, count, total) in samples.get("histograms", {}).items():
+            metric = by_name.get(name)
+            if isinstance(metric, Histogram):
+                metric.merge(counts, count, total)
+        for name, values in samples.get("counters", {}).items():
+            metric = by_name.get(name)
+            if isinstance(metric, Counter):
+                for label_value, amount in values.items():
+                    metric.inc(label_value, amount)
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+async def start_metrics_server(registry: MetricsRegistry, host: str, port: int) -> web.AppRunner:
+    async def handle_metrics(request: web.Request) -> web.Response:
+        return web.Response(text=registry.render(), content_type="text/plain", charset="utf-8")
+
+    app = web.Application()
+    app.router.add_get("/metrics", handle_metrics)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    return runner
+
+class SamplingProfiler:
+    """Samples one thread's Python stack from a background thread.
+
+    Meant for the event-loop thread: it reports which functions the loop
+    is sitting in without instrumenting any code.
+    """
+
+    def __init__(self, interval: float = 0.005, max_depth: int = 40):
+        self.interval = interval
+        self.max_depth = max_depth
+        self.samples = 0
+        self.own = FrameCounter()
+        self.total = FrameCounter()
+
+    def run(self, thread_id: int, duration: float):
+        deadline = time.monotonic() + duration
+        while time.monotonic() < deadline:
+            frame = sys._current_frames().get(thread_id)
+            if frame is not None:
+                self._record(frame)
+            time.sleep(self.interval)
+
+    def _record(self, frame):
+        seen = set()
+        depth = 0
+        first = True
+        self.samples += 1
+        while frame is not None and depth < self.max_depth:
+            code = frame.f_code
+            key = f"{code.co_name} ({code.co_filename}:{code.co_firstlineno})"
+            if first:
+                self.own[key] += 1
+                first = False
+            if key not in seen:
+                self.total[key] += 1
+                seen.add(key)
+            frame = frame.f_back
+            depth += 1
+
+    def report(self, top: int = 25) -> str:
+        if not self.samples:
+            return "No samples collected."
+        lines = [f"{self.samples} samples every {self.interval * 1000:.1f} ms", "", "Self time:"]
+        for key, n in self.own.most_common(top):
+            lines.append(f"{n / self.samples:7.1%}  {key}")
+        lines += ["", "Cumulative:"]
+        for key, n in self.total.most_common(top):
+            lines.append(f"{n / self.samples:7.1%}  {key}")
+        return "\n".join(lines)
+
+async def profile_event_loop(duration: float, interval: float = 0.005, thread_id: Optional[int] = None) -> SamplingProfiler:
+    profiler = SamplingProfiler(interval)
+    await asyncio.to_thread(profiler.run, thread_id or threading.get_ident(), duration)
+    return profiler
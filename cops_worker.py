@@ -0,0 +1,298 @@
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import os
+import sys
+from typing import Awaitable, Callable, Dict, List, Optional, Set
+
+import cops_checker
+from cops_checker import CheckResult, RetryPolicy, current_job, fetch_usernames_batch, metrics
+
+logger = logging.getLogger(__name__)
+
+# One JSON message per line; a shard or its results can be far past asyncio's 64 KiB default
+STREAM_LIMIT = 64 * 1024 * 1024
+RESTART_DELAY = 1.0
+
+async def _send(writer: asyncio.StreamWriter, message: dict):
+    writer.write(json.dumps(message, ensure_ascii=False).encode('utf-8') + b"\n")
+    await writer.drain()
+
+class RemoteScheduler:
+    """Worker-side stand-in for RequestScheduler; every token comes from the coordinator."""
+
+    def __init__(self, writer: asyncio.StreamWriter):
+        self.rate = 0.0
+        self._writer = writer
+        self._ids = itertools.count()
+        self._waiting: Dict[int, asyncio.Future] = {}
+
+    async def call(self, message: dict):
+        """Send a request to the coordinator and wait for its reply."""
+        request_id = next(self._ids)
+        future = asyncio.get_running_loop().create_future()
+        self._waiting[request_id] = future
+        await _send(self._writer, {**message, "id": request_id})
+        return await future
+
+    def reply(self, request_id: int, value):
+        future = self._waiting.pop(request_id, None)
+        if future is not None and not future.done():
+            future.set_result(value)
+
+    async def acquire(self, job=None) -> bool:
+        return await self.call({"type": "acquire", "job": job})
+
+    def record(self, ok: bool, probe: bool = False):
+        # The coordinator's circuit breaker sees outcomes from every process
+        asyncio.create_task(_send(self._writer, {"type": "record", "ok": ok, "probe": probe}))
+
+    def throttle(self, retry_after: float):
+        asyncio.create_task(_send(self._writer, {"type": "throttle", "retry_after": retry_after}))
+
+    def relax(self):
+        asyncio.create_task(_send(self._writer, {"type": "relax"}))
+
+    def pending(self) -> int:
+        return len(self._waiting)
+
+class RemoteRetryPolicy(RetryPolicy):
+    """Worker-side RetryPolicy; the retry budget lives on the coordinator.
+
+    Attempt and deadline limits are checked locally. Tokens are spent, and
+    credited for each request, by the coordinator's own policy, so the
+    budget holds across every process.
+    """
+
+    def __init__(self, scheduler: RemoteScheduler, policy: RetryPolicy):
+        super().__init__(policy.attempts, policy.base_delay, policy.max_delay, policy.deadline,
+                         policy.budget_ratio, policy.max_tokens)
+        self._scheduler = scheduler
+
+    def on_request(self):
+        # Credited by the coordinator when it grants the request token
+        pass
+
+    async def spend(self) -> bool:
+        return await self._scheduler.call({"type": "retry"})
+
+async def _handle_shard(writer: asyncio.StreamWriter, message: dict):
+    current_job.set(message.get("job"))
+    # Shards only hold cache misses; the coordinator owns the availability cache
+    names = message["names"]
+    size = max(1, message.get("batch", 1))
+    try:
+        batches = await asyncio.gather(*(
+            fetch_usernames_batch(names[i:i + size]) for i in range(0, len(names), size)
+        ))
+        samples = metrics.collect_samples()
+        if samples:
+            # Latency, response and retry metrics are reported by the coordinator
+            await _send(writer, {"type": "metrics", "samples": samples})
+        await _send(writer, {"type": "results", "id": message["id"], "results": [r for batch in batches for r in batch]})
+    except Exception as e:
+        logger.error(f"Shard {message['id']} failed: {e}")
+        await _send(writer, {"type": "failed", "id": message["id"], "error": str(e)})
+
+async def run_worker(socket_path: str):
+    reader, writer = await asyncio.open_unix_connection(socket_path, limit=STREAM_LIMIT)
+    scheduler = RemoteScheduler(writer)
+    cops_checker.request_scheduler = scheduler
+    cops_checker.retry_policy = RemoteRetryPolicy(scheduler, cops_checker.retry_policy)
+    tasks = set()
+    try:
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            message = json.loads(line)
+            if message["type"] == "reply":
+                scheduler.reply(message["id"], message["value"])
+            elif message["type"] == "shard":
+                task = asyncio.create_task(_handle_shard(writer, message))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+    except ValueError as e:
+        # Oversized or malformed line; the coordinator fails our shards and restarts us
+        logger.error(f"Dropping coordinator connection: {e}")
+    finally:
+        for task in tasks:
+            task.cancel()
+        await cops_checker.close()
+        writer.close()
+
+class WorkerConnection:
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.reader = reader
+        self.writer = writer
+        self.shards: Dict[int, asyncio.Future] = {}
+
+class WorkerPool:
+    """Coordinator for local checker processes.
+
+    Workers connect over a Unix socket. The coordinator hands each one
+    shards of names and answers their token requests from the bot's own
+    RequestScheduler and RetryPolicy, so the global rate, per-job weights,
+    circuit breaker and retry budget hold across every process. Workers
+    that exit are restarted.
+    """
+
+    def __init__(self, size: int, socket_path: str, scheduler, retry_policy: RetryPolicy):
+        self.size = size
+        self.socket_path = socket_path
+        self.scheduler = scheduler
+        self.retry_policy = retry_policy
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._processes: List[asyncio.subprocess.Process] = []
+        self._workers: List[WorkerConnection] = []
+        self._supervisors: Set[asyncio.Task] = set()
+        self._closing = False
+        self._ids = itertools.count()
+
+    @property
+    def ready(self) -> bool:
+        return bool(self._workers)
+
+    async def start(self):
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+        self._server = await asyncio.start_unix_server(self._handle_worker, path=self.socket_path, limit=STREAM_LIMIT)
+        for _ in range(self.size):
+            await self._spawn()
+        logger.info(f"Started {self.size} checker worker processes on {self.socket_path}")
+
+    async def _spawn(self):
+        process = await asyncio.create_subprocess_exec(sys.executable, os.path.abspath(__file__), self.socket_path)
+        self._processes.append(process)
+        task = asyncio.create_task(self._supervise(process))
+        self._supervisors.add(task)
+        task.add_done_callback(self._supervisors.discard)
+
+    async def _supervise(self, process: asyncio.subprocess.Process):
+        code = await process.wait()
+        self._processes.remove(process)
+        if self._closing:
+            return
+        logger.warning(f"Checker worker {process.pid} exited with code {code}, restarting")
+        await asyncio.sleep(RESTART_DELAY)
+        if self._closing:
+            return
+        try:
+            await self._spawn()
+        except OSError as e:
+            logger.error(f"Failed to restart checker worker: {e}")
+
+    async def _handle_worker(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        worker = WorkerConnection(reader, writer)
+        self._workers.append(worker)
+        grants = set()
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                message = json.loads(line)
+                kind = message["type"]
+                if kind == "acquire":
+                    task = asyncio.create_task(self._grant(worker, message["id"], message.get("job")))
+                    grants.add(task)
+                    task.add_done_callback(grants.discard)
+                elif kind == "retry":
+                    task = asyncio.create_task(self._approve_retry(worker, message["id"]))
+                    grants.add(task)
+                    task.add_done_callback(grants.discard)
+                elif kind == "throttle":
+                    self.scheduler.throttle(message["retry_after"])
+                elif kind == "relax":
+                    self.scheduler.relax()
+                elif kind == "record":
+                    self.scheduler.record(message["ok"], message["probe"])
+                elif kind == "metrics":
+                    metrics.merge_samples(message["samples"])
+                elif kind in ("results", "failed"):
+                    future = worker.shards.pop(message["id"], None)
+                    if future is not None and not future.done():
+                        if kind == "results":
+                            future.set_result([CheckResult.from_row(row) for row in message["results"]])
+                        else:
+                            future.set_exception(RuntimeError(message["error"]))
+        except (ConnectionError, ValueError) as e:
+            # ValueError covers bad JSON and lines over STREAM_LIMIT
+            logger.error(f"Worker connection error: {e}")
+        finally:
+            self._workers.remove(worker)
+            for task in grants:
+                task.cancel()
+            for future in worker.shards.values():
+                if not future.done():
+                    future.set_exception(ConnectionError("worker disconnected"))
+            writer.close()
+
+    async def _grant(self, worker: WorkerConnection, request_id: int, job):
+        probe = await self.scheduler.acquire(job)
+        self.retry_policy.on_request()
+        await _send(worker.writer, {"type": "reply", "id": request_id, "value": probe})
+
+    async def _approve_retry(self, worker: WorkerConnection, request_id: int):
+        allowed = await self.retry_policy.spend()
+        await _send(worker.writer, {"type": "reply", "id": request_id, "value": allowed})
+
+    async def _run_shard(self, job, names: List[str], batch_size: int) -> List[CheckResult]:
+        worker = min(self._workers, key=lambda w: len(w.shards))
+        shard_id = next(self._ids)
+        future = asyncio.get_running_loop().create_future()
+        worker.shards[shard_id] = future
+        await _send(worker.writer, {"type": "shard", "id": shard_id, "job": job, "names": names, "batch": batch_size})
+        return await future
+
+    async def check(self, job, names: List[str], batch_size: int,
+                    fallback: Optional[Callable[[List[str]], Awaitable[List[CheckResult]]]] = None
+                    ) -> List[CheckResult]:
+        """Split names into one shard per worker and return results in input order.
+
+        A shard whose worker fails or disconnects is handed to `fallback`
+        when one is given; the other shards keep their results.
+        """
+        per_shard = max(batch_size, -(-len(names) // max(1, len(self._workers))))
+        per_shard = -(-per_shard // batch_size) * batch_size
+        shards = [names[i:i + per_shard] for i in range(0, len(names), per_shard)]
+        outcomes = await asyncio.gather(*(self._run_shard(job, shard, batch_size) for shard in shards),
+                                        return_exceptions=True)
+        results = []
+        for shard, outcome in zip(shards, outcomes):
+            if isinstance(outcome, BaseException):
+                if fallback is None or not isinstance(outcome, (ConnectionError, RuntimeError)):
+                    raise outcome
+                logger.warning(f"Worker shard of {len(shard)} names failed ({outcome}), checking it locally")
+                outcome = await fallback(shard)
+            results.extend(outcome)
+        return results
+
+    async def close(self):
+        self._closing = True
+        for task in list(self._supervisors):
+            task.cancel()
+        for worker in list(self._workers):
+            worker.writer.close()
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+        for process in list(self._processes):
+            if process.returncode is None:
+                process.terminate()
+                await process.wait()
+        self._processes.clear()
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="name_cops checker worker process")
+    parser.add_argument("socket", help="Coordinator Unix socket path")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format=f'%(asctime)s - worker {os.getpid()} - %(levelname)s - %(message)s')
+    try:
+        asyncio.run(run_worker(args.socket))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,119 @@
+import argparse
+import asyncio
+import random
+import zlib
+from typing import Optional
+
+from aiohttp import web
+
+class MockProfileApi:
+    """Local stand-in for the Critical Ops /api/public/profile endpoint.
+
+    Whether a name is taken is a stable function of the name, so repeated
+    runs see the same answers. Latency and failure injection are random.
+    """
+
+    def __init__(self, latency: float = 0.02, jitter: float = 0.0, taken_ratio: float = 0.5,
+                 error_rate: float = 0.0, forbidden_rate: float = 0.0, timeout_rate: float = 0.0,
+                 rate_limit_rate: float = 0.0, unavailable_rate: float = 0.0, timeout_delay: float = 30.0,
+                 seed: Optional[int] = None):
+        self.latency = latency
+        self.jitter = jitter
+        self.taken_ratio = taken_ratio
+        self.error_rate = error_rate
+        self.forbidden_rate = forbidden_rate
+        self.timeout_rate = timeout_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.unavailable_rate = unavailable_rate
+        self.timeout_delay = timeout_delay
+        self.requests = 0
+        self.names = 0
+        self._random = random.Random(seed)
+
+    def is_taken(self, username: str) -> bool:
+        return zlib.crc32(username.lower().encode('utf-8')) % 10000 < self.taken_ratio * 10000
+
+    async def handle_profile(self, request: web.Request) -> web.Response:
+        self.requests += 1
+        names = [n for n in request.query.get("usernames", "").split(",") if n]
+        self.names += len(names)
+
+        delay = self.latency + self._random.gauss(0, self.jitter) if self.jitter else self.latency
+        await asyncio.sleep(max(0.0, delay))
+
+        roll = self._random.random()
+        if roll < self.timeout_rate:
+            await asyncio.sleep(self.timeout_delay)
+            return web.Response(status=504)
+        roll -= self.timeout_rate
+        if roll < self.error_rate:
+            return web.json_response({"error": "internal server error"}, status=500)
+        roll -= self.error_rate
+        if roll < self.forbidden_rate:
+            return web.Response(status=403, text="Forbidden")
+        roll -= self.forbidden_rate
+        if roll < self.rate_limit_rate:
+            return web.Response(status=429, headers={"Retry-After": "1"})
+        roll -= self.rate_limit_rate
+        if roll < self.unavailable_rate:
+            return web.Response(status=503, text="Service Unavailable")
+
+        taken = [n for n in names if self.is_taken(n)]
+        if len(names) == 1 and not taken:
+            # The real API answers a free single name either way
+            return web.json_response({"error": 53} if self._random.random() < 0.5 else [])
+        return web.json_response([
+            {"basicInfo": {"name": n, "userID": zlib.crc32(n.lower().encode('utf-8'))}}
+            for n in taken
+        ])
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_get("/api/public/profile", self.handle_profile)
+        return app
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0):
+        """Start serving; returns (runner, profile URL). Port 0 picks a free port."""
+        runner = web.AppRunner(self.app())
+        await runner.setup()
+        site = web.TCPSite(runner, host, port)
+        await site.start()
+        bound_port = site._server.sockets[0].getsockname()[1]
+        return runner, f"http://{host}:{bound_port}/api/public/profile"
+
+def add_mock_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument("--latency", type=float, default=0.02, help="Mean response latency in seconds")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Latency standard deviation in seconds")
+    parser.add_argument("--taken-ratio", type=float, default=0.5, help="Fraction of names reported as taken")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests answered with HTTP 500")
+    parser.add_argument("--forbidden-rate", type=float, default=0.0, help="Fraction of requests answered with HTTP 403")
+    parser.add_argument("--timeout-rate", type=float, default=0.0, help="Fraction of requests that hang past the client timeout")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="Fraction of requests answered with HTTP 429")
+    parser.add_argument("--unavailable-rate", type=float, default=0.0, help="Fraction of requests answered with HTTP 503")
+    parser.add_argument("--seed", type=int, default=None)
+
+def mock_from_arguments(args: argparse.Namespace, timeout_delay: float = 30.0) -> MockProfileApi:
+    return MockProfileApi(
+        latency=args.latency, jitter=args.jitter, taken_ratio=args.taken_ratio,
+        error_rate=args.error_rate, forbidden_rate=args.forbidden_rate, timeout_rate=args.timeout_rate,
+        rate_limit_rate=args.rate_limit_rate, unavailable_rate=args.unavailable_rate,
+        timeout_delay=timeout_delay, seed=args.seed
+    )
+
+async def serve(args: argparse.Namespace):
+    runner, url = await mock_from_arguments(args).start(args.host, args.port)
+    print(f"Mock profile API listening on {url}")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a local mock of the Critical Ops profile API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    add_mock_arguments(parser)
+    try:
+        asyncio.run(serve(parser.parse_args()))
+    except KeyboardInterrupt:
+        pass
@@ -1,156 +1,1036 @@
 import discord
-from discord.ext import commands, tasks
+from discord.ext import commands
 from discord import app_commands
-import requests
+import aiohttp
 import asyncio
 import random
 import os
-import json
 import logging
-from typing import Dict, List, Optional, Set
+from typing import Dict, List, Optional, Set, Tuple
+from collections import deque
+from cops_metrics import profile_event_loop, start_metrics_server
+from cops_worker import WorkerPool
+from cops_checker import (
+    CONFIG, REPORT_FIELDS, SKIP_TAKEN, AgingBloomFilter, CheckResult, PreflightStats, Status, UsernameIngest, UsernameList, api_client, api_latency,
+    api_responses, availability_cache, check_username_availability, check_usernames_batch, circuit_breaker,
+    current_job, fetch_usernames_batch, metrics, preflight, report_row, request_scheduler, retries, retries_denied,
+    retry_policy, scheduler_wait, username_rules
+)
 import time
 import io
+import csv
+import gzip
+import json
+import heapq
+import threading
+import zlib
+import sqlite3
+import mmap
+import struct
+import hashlib
+import tempfile
+from array import array
+
+try:
+    import numpy as np
+except ImportError:
+    # Only /gen ranked:true needs it
+    np = None
 
-CONFIG = {
+CONFIG.update({
     'TOKEN': os.getenv('DISCORD_BOT_TOKEN'),
     'ALLOWED_ROLE': os.getenv('ALLOWED_ROLE', 'names'),
     'ALLOWED_GUILD_ID': int(os.getenv('ALLOWED_GUILD_ID', '0')),
     'HITS_CHANNEL_ID': int(os.getenv('HITS_CHANNEL_ID', '0')),
     'OWNER_ID': int(os.getenv('OWNER_ID', '0')),
     'BATCH_SIZE': int(os.getenv('BATCH_SIZE', '10')),
-    'MAX_FILE_SIZE': int(os.getenv('MAX_FILE_SIZE', '1000000')),
-    'REQUEST_DELAY_MIN': float(os.getenv('REQUEST_DELAY_MIN', '0.5')),
-    'REQUEST_DELAY_MAX': float(os.getenv('REQUEST_DELAY_MAX', '2.0')),
-    'DISCORD_MESSAGE_DELAY': float(os.getenv('DISCORD_MESSAGE_DELAY', '1.0'))
-}
+    'MAX_FILE_SIZE': int(os.getenv('MAX_FILE_SIZE', '50000000')),
+    'DISCORD_MESSAGE_DELAY': float(os.getenv('DISCORD_MESSAGE_DELAY', '1.0')),
+    'OUTPUT_ATTACHMENT_THRESHOLD': int(os.getenv('OUTPUT_ATTACHMENT_THRESHOLD', '3')),
+    'JOB_CONCURRENCY': int(os.getenv('JOB_CONCURRENCY', '1')),
+    'JOB_DB_PATH': os.getenv('JOB_DB_PATH', 'name_cops.db'),
+    'STORE_FLUSH_INTERVAL': float(os.getenv('STORE_FLUSH_INTERVAL', '5.0')),
+    'DICT_CACHE_PATH': os.getenv('DICT_CACHE_PATH', 'name_cops_dict.bin'),
+    'GEN_RANK_TEMPERATURE': float(os.getenv('GEN_RANK_TEMPERATURE', '0.5')),
+    'METRICS_HOST': os.getenv('METRICS_HOST', '127.0.0.1'),
+    'METRICS_PORT': int(os.getenv('METRICS_PORT', '0')),
+    'LOOP_BASE_INTERVAL': float(os.getenv('LOOP_BASE_INTERVAL', '300')),
+    'LOOP_MAX_BACKOFF': int(os.getenv('LOOP_MAX_BACKOFF', '32')),
+    'TAKEN_FILTER_PATH': os.getenv('TAKEN_FILTER_PATH', 'name_cops_taken.bin'),
+    'TAKEN_FILTER_CAPACITY': int(os.getenv('TAKEN_FILTER_CAPACITY', '5000000')),
+    'TAKEN_FILTER_WINDOW': float(os.getenv('TAKEN_FILTER_WINDOW', '86400')),
+    'INACTIVITY_TIMEOUT': float(os.getenv('INACTIVITY_TIMEOUT', '3600')),
+    'RESULT_LINES': os.getenv('RESULT_LINES', '1') not in ('0', 'false', 'no'),
+    'REPORT_FORMAT': os.getenv('REPORT_FORMAT', 'csv'),
+    'REPORT_MAX_BYTES': int(os.getenv('REPORT_MAX_BYTES', '8000000')),
+    'WORKER_PROCESSES': int(os.getenv('WORKER_PROCESSES', '0')),
+    'WORKER_SOCKET': os.getenv('WORKER_SOCKET', os.path.join(tempfile.gettempdir(), f'name_cops_{os.getpid()}.sock'))
+})
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+discord_send_latency = metrics.histogram('cops_discord_send_seconds', 'Discord message send latency')
+
 allowed_users: Set[int] = set()
 
-def load_dictionary_words():
+DICT_PATHS = [
+    '/usr/share/dict/words',
+    '/usr/dict/words',
+    '/usr/share/dict/american-english',
+    '/usr/share/dict/british-english'
+]
+DICT_DOWNLOAD_URL = "https://raw.githubusercontent.com/dwyl/english-words/master/words_alpha.txt"
+DICT_MAGIC = b"NCDICT1\n"
+# magic, source mtime, source sha256, word count, source name length
+DICT_HEADER = struct.Struct("<8sd32sIH")
+
+class WordList:
+    """Read-only word list over a compiled dictionary buffer (usually an mmap)."""
+    
+    def __init__(self, buffer, source: str, mtime: float, digest: bytes, count: int, offsets_start: int):
+        self._buffer = buffer
+        self.source = source
+        self.mtime = mtime
+        self.digest = digest
+        self._count = count
+        self._offsets = memoryview(buffer)[offsets_start:offsets_start + 4 * (count + 1)].cast('I')
+        self._data_start = offsets_start + 4 * (count + 1)
+    
+    @classmethod
+    def from_buffer(cls, buffer) -> Optional['WordList']:
+        if len(buffer) < DICT_HEADER.size or buffer[:len(DICT_MAGIC)] != DICT_MAGIC:
+            return None
+        _, mtime, digest, count, source_len = DICT_HEADER.unpack_from(buffer, 0)
+        source = bytes(buffer[DICT_HEADER.size:DICT_HEADER.size + source_len]).decode('utf-8')
+        offsets_start = (DICT_HEADER.size + source_len + 3) & ~3
+        return cls(buffer, source, mtime, digest, count, offsets_start)
+    
+    @staticmethod
+    def pack(words: List[str], source: str, mtime: float, digest: bytes) -> bytes:
+        encoded = [w.encode('utf-8') for w in words]
+        source_bytes = source.encode('utf-8')
+        header = DICT_HEADER.pack(DICT_MAGIC, mtime, digest, len(encoded), len(source_bytes)) + source_bytes
+        header += b"\0" * (-len(header) % 4)
+        offsets = array('I', [0])
+        for word in encoded:
+            offsets.append(offsets[-1] + len(word))
+        return header + offsets.tobytes() + b"".join(encoded)
+    
+    def __len__(self):
+        return self._count
+    
+    def __getitem__(self, index: int) -> str:
+        if index < 0:
+            index += self._count
+        if not 0 <= index < self._count:
+            raise IndexError("word index out of range")
+        start = self._data_start + self._offsets[index]
+        end = self._data_start + self._offsets[index + 1]
+        return bytes(self._buffer[start:end]).decode('utf-8')
+    
+    def __iter__(self):
+        for i in range(self._count):
+            yield self[i]
+    
+    @property
+    def offsets(self) -> memoryview:
+        return self._offsets
+    
+    def data(self) -> memoryview:
+        """All words back to back; word i is data[offsets[i]:offsets[i + 1]]."""
+        return memoryview(self._buffer)[self._data_start:self._data_start + self._offsets[self._count]]
+
+def _filter_dictionary_lines(lines) -> List[str]:
     words = set()
-    dict_paths = [
-        '/usr/share/dict/words',
-        '/usr/dict/words',
-        '/usr/share/dict/american-english',
-        '/usr/share/dict/british-english'
-    ]
+    for line in lines:
+        word = line.strip()
+        if word.isalpha() and 3 <= len(word) <= 12:
+            words.add(word.capitalize())
+    return sorted(words)
+
+def _file_sha256(path: str) -> bytes:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.digest()
+
+def _open_compiled_dictionary(path: str) -> Optional[WordList]:
+    try:
+        with open(path, 'rb') as f:
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):
+        return None
+    return WordList.from_buffer(buffer)
+
+def _is_compiled_fresh(compiled: WordList, source: Optional[str]) -> bool:
+    if source is None:
+        # No local dictionary; keep whatever we compiled last time
+        return True
+    if compiled.source != source:
+        return False
+    if compiled.mtime == os.stat(source).st_mtime:
+        return True
+    return compiled.digest == _file_sha256(source)
+
+def _compile_dictionary(words: List[str], source: str, mtime: float, digest: bytes) -> WordList:
+    packed = WordList.pack(words, source, mtime, digest)
+    path = CONFIG['DICT_CACHE_PATH']
+    try:
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(packed)
+        os.replace(tmp_path, path)
+        compiled = _open_compiled_dictionary(path)
+        if compiled is not None:
+            return compiled
+    except OSError as e:
+        logger.warning(f"Could not write compiled dictionary to {path}: {e}")
+    return WordList.from_buffer(packed)
+
+def load_dictionary_words() -> WordList:
+    source = next((path for path in DICT_PATHS if os.path.exists(path)), None)
+    compiled = _open_compiled_dictionary(CONFIG['DICT_CACHE_PATH'])
+    if compiled is not None and len(compiled) and _is_compiled_fresh(compiled, source):
+        logger.info(f"Loaded {len(compiled)} words from compiled dictionary ({compiled.source})")
+        return compiled
     
-    for path in dict_paths:
-        try:
-            with open(path, 'r', encoding='utf-8', errors='ignore') as f:
-                for line in f:
-                    word = line.strip()
-                    if word.isalpha() and 3 <= len(word) <= 12:
-                        words.add(word.capitalize())
-            if words:
-                logger.info(f"Loaded {len(words)} words from {path}")
-                return list(words)
-        except FileNotFoundError:
-            continue
+    if source is not None:
+        with open(source, 'r', encoding='utf-8', errors='ignore') as f:
+            words = _filter_dictionary_lines(f)
+        if words:
+            logger.info(f"Compiled {len(words)} words from {source}")
+            return _compile_dictionary(words, source, os.stat(source).st_mtime, _file_sha256(source))
     
     logger.warning("No system dictionary found. Attempting to download word list...")
     try:
         import urllib.request
-        url = "https://raw.githubusercontent.com/dwyl/english-words/master/words_alpha.txt"
-        response = urllib.request.urlopen(url, timeout=30)
-        content = response.read().decode('utf-8')
-        for line in content.splitlines():
-            word = line.strip()
-            if word.isalpha() and 3 <= len(word) <= 12:
-                words.add(word.capitalize())
+        response = urllib.request.urlopen(DICT_DOWNLOAD_URL, timeout=30)
+        content = response.read()
+        words = _filter_dictionary_lines(content.decode('utf-8').splitlines())
         if words:
             logger.info(f"Downloaded {len(words)} words from online dictionary")
-            return list(words)
+            return _compile_dictionary(words, DICT_DOWNLOAD_URL, 0.0, hashlib.sha256(content).digest())
     except Exception as e:
         logger.error(f"Failed to download dictionary: {e}")
     
     logger.error("Failed to load dictionary. /gen command will not work properly")
-    return []
-
-DICTIONARY_WORDS = load_dictionary_words()
-
-if not DICTIONARY_WORDS:
-    logger.error("Failed to load dictionary. Bot may not work properly for /gen command")
-else:
-    logger.info(f"Total dictionary size: {len(DICTIONARY_WORDS)} words")
-
-def generate_igns(count=500):
-    if count >= len(DICTIONARY_WORDS):
-        shuffled = DICTIONARY_WORDS.copy()
-        random.shuffle(shuffled)
-        return shuffled
-    
-    shuffled = DICTIONARY_WORDS.copy()
-    random.shuffle(shuffled)
-    return shuffled[:count]
-
-def generate_user_agents(n=1000):
-    browsers = ["Chrome", "Safari", "Edge", "Firefox"]
-    platforms = [
-        "Windows NT 10.0; Win64; x64",
-        "Macintosh; Intel Mac OS X 13_5",
-        "X11; Linux x86_64",
-        "iPhone; CPU iPhone OS 17_5 like Mac OS X"
-    ]
-    user_agents = []
-    for _ in range(n):
-        browser = random.choice(browsers)
-        platform = random.choice(platforms)
-        if browser == "Chrome":
-            ua = f"Mozilla/5.0 ({platform}) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/{random.randint(100,120)}.0.{random.randint(1000,6000)}.{random.randint(0,200)} Safari/537.36"
-        elif browser == "Safari":
-            ua = f"Mozilla/5.0 ({platform}) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/{random.randint(14,18)}.{random.randint(0,9)} Safari/605.1.15"
-        elif browser == "Edge":
-            ua = f"Mozilla/5.0 ({platform}) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/{random.randint(100,120)}.0.{random.randint(1000,6000)}.{random.randint(0,200)} Safari/537.36 Edg/{random.randint(100,120)}.0.{random.randint(1000,6000)}.{random.randint(0,200)}"
+    return WordList.from_buffer(WordList.pack([], "", 0.0, b"\0" * 32))
+
+VOWELS = frozenset("aeiouAEIOU")
+
+def word_pattern(word: str) -> str:
+    return "".join("V" if c in VOWELS else "C" for c in word)
+
+class DictionaryIndex:
+    """Length and consonant/vowel pattern buckets over a sorted WordList.
+    
+    Buckets hold ascending word indices, so a prefix narrows each bucket
+    to a contiguous range by binary search.
+    """
+    
+    def __init__(self, words: WordList):
+        self.words = words
+        self.by_length: Dict[int, array] = {}
+        self.by_pattern: Dict[str, array] = {}
+        for i, word in enumerate(words):
+            self.by_length.setdefault(len(word), array('I')).append(i)
+            self.by_pattern.setdefault(word_pattern(word), array('I')).append(i)
+    
+    def _prefix_range(self, indices: array, prefix: str) -> Tuple[int, int]:
+        if not prefix:
+            return 0, len(indices)
+        n = len(prefix)
+        lo, hi = 0, len(indices)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.words[indices[mid]][:n] < prefix:
+                lo = mid + 1
+            else:
+                hi = mid
+        start, hi = lo, len(indices)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.words[indices[mid]][:n] <= prefix:
+                lo = mid + 1
+            else:
+                hi = mid
+        return start, lo
+    
+    def _segments(self, min_len: int, max_len: int, prefix: str, pattern: str):
+        if pattern:
+            buckets = [self.by_pattern.get(pattern)] if min_len <= len(pattern) <= max_len else []
         else:
-            ua = f"Mozilla/5.0 ({platform}; rv:{random.randint(90,118)}.0) Gecko/20100101 Firefox/{random.randint(90,118)}.0"
-        user_agents.append(ua)
-    return user_agents
+            # Only the lengths the word list has, whatever range was asked for
+            buckets = [self.by_length[length] for length in sorted(self.by_length) if min_len <= length <= max_len]
+        segments = []
+        for indices in buckets:
+            if indices:
+                start, end = self._prefix_range(indices, prefix)
+                if start < end:
+                    segments.append((indices, start, end))
+        return segments
+    
+    def sample(self, count: int, min_len: int = 3, max_len: int = 12, prefix: str = "", pattern: str = "") -> List[str]:
+        segments = self._segments(min_len, max_len, prefix.capitalize(), pattern.upper())
+        sizes = [end - start for _, start, end in segments]
+        total = sum(sizes)
+        picks = []
+        for n in random.sample(range(total), min(count, total)):
+            for (indices, start, _), size in zip(segments, sizes):
+                if n < size:
+                    picks.append(self.words[indices[start + n]])
+                    break
+                n -= size
+        return picks
+    
+    def ranked_sample(self, scores, count: int, min_len: int = 3, max_len: int = 12, prefix: str = "",
+                      pattern: str = "", temperature: float = 0.5) -> List[str]:
+        """Best `count` matches by score, highest first.
+        
+        With a positive temperature the picks are a score-weighted sample
+        without replacement (Gumbel top-k); at zero it is the plain top-k.
+        """
+        segments = self._segments(min_len, max_len, prefix.capitalize(), pattern.upper())
+        if not segments:
+            return []
+        candidates = np.concatenate([np.frombuffer(indices, dtype=np.uint32)[start:end] for indices, start, end in segments])
+        candidate_scores = scores[candidates]
+        keys = candidate_scores.astype(np.float64)
+        if temperature > 0:
+            keys = keys / temperature + _rank_rng.gumbel(size=len(keys))
+        k = min(count, len(candidates))
+        top = np.argpartition(-keys, k - 1)[:k]
+        top = top[np.argsort(-candidate_scores[top], kind='stable')]
+        return [self.words[int(i)] for i in candidates[top]]
 
-class UserData:
+SCORES_MAGIC = b"NCSCORE1"
+# magic, dictionary digest, word count, scoring version
+SCORES_HEADER = struct.Struct("<8s32sII")
+# Bump when the features or weights change so cached scores are recomputed
+SCORE_VERSION = 1
+# Weights for length, letter rarity, pronounceability and repeated characters
+SCORE_WEIGHTS = (1.0, 0.4, 0.8, 0.6)
+
+_rank_rng = np.random.default_rng() if np is not None else None
+
+def score_words(words: WordList):
+    """Score every dictionary word in one vectorized pass; higher is more valuable.
+    
+    Short words with uncommon letters that still read naturally score
+    highest. Letter and bigram statistics come from the dictionary itself,
+    and each feature is standardized before weighting.
+    """
+    count = len(words)
+    if not count:
+        return np.zeros(0, dtype=np.float32)
+    offsets = np.frombuffer(words.offsets, dtype=np.uint32).astype(np.int64)
+    data = np.frombuffer(words.data(), dtype=np.uint8)
+    starts = offsets[:-1]
+    lengths = np.diff(offsets).astype(np.float64)
+    
+    # a-z -> 0..25, anything else (non-ASCII bytes) -> 26
+    lower = data | 0x20
+    letters = np.where((lower >= ord('a')) & (lower <= ord('z')), lower - ord('a'), 26).astype(np.int64)
+    
+    letter_counts = np.bincount(letters, minlength=27) + 1.0
+    surprisal = -np.log(letter_counts / letter_counts.sum())
+    rarity = np.add.reduceat(surprisal[letters], starts) / lengths
+    
+    # Pairs that straddle two words are masked out of every per-word sum
+    inside = np.ones(len(letters) - 1, dtype=bool)
+    inside[starts[1:] - 1] = False
+    pairs = letters[:-1] * 27 + letters[1:]
+    pair_counts = np.bincount(pairs[inside], minlength=27 * 27).reshape(27, 27) + 1.0
+    transition = np.log(pair_counts / pair_counts.sum(axis=1, keepdims=True)).ravel()
+    bigram_logp = np.where(inside, transition[pairs], 0.0)
+    pronounceability = np.add.reduceat(bigram_logp, starts) / np.maximum(lengths - 1, 1)
+    repeats = np.add.reduceat((inside & (letters[:-1] == letters[1:])).astype(np.float64), starts)
+    
+    score = np.zeros(count)
+    for weight, feature in zip(SCORE_WEIGHTS, (-lengths, rarity, pronounceability, -repeats)):
+        spread = feature.std()
+        score += weight * (feature - feature.mean()) / (spread if spread else 1.0)
+    return score.astype(np.float32)
+
+def load_word_scores(words: WordList):
+    """Cached scores for `words`, recomputed when the dictionary or scoring changes."""
+    path = f"{CONFIG['DICT_CACHE_PATH']}.scores"
+    try:
+        with open(path, 'rb') as f:
+            magic, digest, count, version = SCORES_HEADER.unpack(f.read(SCORES_HEADER.size))
+            if magic == SCORES_MAGIC and digest == words.digest and count == len(words) and version == SCORE_VERSION:
+                scores = np.fromfile(f, dtype='<f4', count=count)
+                if len(scores) == count:
+                    return scores
+    except (OSError, struct.error):
+        pass
+    
+    started = time.perf_counter()
+    scores = score_words(words)
+    logger.info(f"Scored {len(words)} dictionary words in {(time.perf_counter() - started) * 1000:.0f} ms")
+    try:
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(SCORES_HEADER.pack(SCORES_MAGIC, words.digest, len(words), SCORE_VERSION))
+            f.write(scores.astype('<f4').tobytes())
+        os.replace(tmp_path, path)
+    except OSError as e:
+        logger.warning(f"Could not write dictionary scores to {path}: {e}")
+    return scores
+
+_dictionary_words: Optional[WordList] = None
+_dictionary_index: Optional[DictionaryIndex] = None
+_dictionary_scores = None
+
+def get_dictionary_words() -> WordList:
+    global _dictionary_words
+    if _dictionary_words is None:
+        _dictionary_words = load_dictionary_words()
+    return _dictionary_words
+
+def get_dictionary_index() -> DictionaryIndex:
+    global _dictionary_index
+    if _dictionary_index is None:
+        _dictionary_index = DictionaryIndex(get_dictionary_words())
+    return _dictionary_index
+
+def get_dictionary_scores():
+    global _dictionary_scores
+    if _dictionary_scores is None:
+        _dictionary_scores = load_word_scores(get_dictionary_index().words)
+    return _dictionary_scores
+
+def generate_igns(count=500, min_len=3, max_len=12, prefix="", pattern="", ranked=False):
+    if ranked:
+        return get_dictionary_index().ranked_sample(get_dictionary_scores(), count, min_len, max_len, prefix, pattern,
+                                                    CONFIG['GEN_RANK_TEMPERATURE'])
+    return get_dictionary_index().sample(count, min_len, max_len, prefix, pattern)
+
+async def ingest_attachment(attachment: discord.Attachment, max_usernames: int) -> UsernameIngest:
+    ingest = UsernameIngest(max_usernames, CONFIG['MAX_INPUT_BYTES'], CONFIG['MAX_INPUT_LINES'])
+    async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=300)) as session:
+        async with session.get(attachment.url) as response:
+            response.raise_for_status()
+            async for chunk in response.content.iter_chunked(65536):
+                # Inflating and deduplicating a chunk can take a while; keep it off the event loop
+                await asyncio.to_thread(ingest.feed, chunk)
+    await asyncio.to_thread(ingest.close)
+    return ingest
+
+class RecheckQueue:
+    """Adaptive recheck order for loop mode.
+    
+    Each name gets a next-due time from its result history: names whose
+    state just changed or that errored come back soon, names that keep
+    returning the same result back off exponentially. The heap holds
+    packed (due_ms << 32 | index) ints; stale entries are skipped on pop.
+    """
+    
+    UNKNOWN, AVAILABLE, TAKEN, ERROR = 0, 1, 2, 3
+    
+    def __init__(self, size: int, base_interval: float = 300.0, max_backoff: int = 32,
+                 skip: Optional[bytearray] = None):
+        self.size = size
+        self.base_interval = base_interval
+        self.max_backoff = max_backoff
+        self.state = bytearray(size)
+        self.streak = array('H', bytes(2 * size))
+        self.due_ms = array('Q', bytes(8 * size))
+        # Everything starts due at t=0, in file order; pre-flight skips never come due
+        self._heap: List[int] = [i for i in range(size) if not skip or not skip[i]]
+        self.checkable = len(self._heap)
+        self._seen = bytearray(size)
+        self.pass_checks = 0
+        self.pass_unique = 0
+    
+    @classmethod
+    def classify(cls, result: CheckResult) -> int:
+        if result.status == Status.AVAILABLE:
+            return cls.AVAILABLE
+        if result.status == Status.TAKEN:
+            return cls.TAKEN
+        return cls.ERROR
+    
+    def _schedule(self, index: int, due: float):
+        due_ms = int(due * 1000)
+        self.due_ms[index] = due_ms
+        heapq.heappush(self._heap, (due_ms << 32) | index)
+    
+    def record(self, index: int, result: CheckResult, now: float):
+        code = self.classify(result)
+        previous = self.state[index]
+        streak = min(self.streak[index] + 1, 65535) if code == previous else 1
+        self.state[index] = code
+        self.streak[index] = streak
+        
+        if code == self.ERROR:
+            interval = self.base_interval / 4 * 2 ** min(streak - 1, 4)
+        elif streak == 1 and previous in (self.AVAILABLE, self.TAKEN):
+            interval = self.base_interval / 4
+        else:
+            interval = self.base_interval * min(2 ** min(streak - 1, 16), self.max_backoff)
+        self._schedule(index, now + interval)
+        
+        self.pass_checks += 1
+        if not self._seen[index]:
+            self._seen[index] = 1
+            self.pass_unique += 1
+    
+    def pop_due(self, limit: int, now: float) -> Tuple[List[int], float]:
+        """Pop up to `limit` due indices; if none are due, also return seconds until the next one."""
+        now_ms = int(now * 1000)
+        indices = []
+        while self._heap and len(indices) < limit:
+            key = self._heap[0]
+            due_ms, index = key >> 32, key & 0xFFFFFFFF
+            if due_ms != self.due_ms[index]:
+                heapq.heappop(self._heap)
+                continue
+            if due_ms > now_ms:
+                break
+            heapq.heappop(self._heap)
+            # Keep it due until its result is recorded
+            self.due_ms[index] = 1 << 62
+            indices.append(index)
+        if indices or not self._heap:
+            return indices, 0.0
+        return indices, ((self._heap[0] >> 32) - now_ms) / 1000
+    
+    def begin_pass(self):
+        self._seen = bytearray(self.size)
+        self.pass_checks = 0
+        self.pass_unique = 0
+    
+    def coverage(self) -> float:
+        return self.pass_unique / self.checkable if self.checkable else 0.0
+
+class SharedList:
+    """An uploaded list held once, however many users uploaded the same content."""
+    
+    __slots__ = ('digest', 'names', 'refs', 'run')
+    
+    def __init__(self, digest: str, names: UsernameList):
+        self.digest = digest
+        self.names = names
+        self.refs = 0
+        self.run: Optional['CheckRun'] = None
+
+class ListRegistry:
+    """Content-addressed, reference-counted store of uploaded lists."""
+    
     def __init__(self):
-        self.file: List[str] = []
-        self.loop: bool = False
+        self._lists: Dict[str, SharedList] = {}
+    
+    def acquire(self, names: UsernameList, digest: Optional[str] = None) -> SharedList:
+        digest = digest or names.digest()
+        shared = self._lists.get(digest)
+        if shared is None:
+            shared = SharedList(digest, names)
+            self._lists[digest] = shared
+        shared.refs += 1
+        return shared
+    
+    def release(self, shared: SharedList):
+        shared.refs -= 1
+        if shared.refs <= 0 and self._lists.get(shared.digest) is shared:
+            del self._lists[shared.digest]
+            shared.names.clear()
+    
+    def __len__(self):
+        return len(self._lists)
+    
+    def __iter__(self):
+        return iter(list(self._lists.values()))
+
+class RunReport:
+    """Streams results into a gzip-compressed CSV or JSONL file for attaching to Discord."""
+    
+    def __init__(self, fmt: str = "csv"):
+        self.format = fmt if fmt in ("csv", "jsonl") else "csv"
+        self.counts: Dict[Status, int] = {}
+        self.size = 0
+        # Small reports stay in memory; large ones spill to a temp file
+        self._file = tempfile.SpooledTemporaryFile(max_size=4 * 1024 * 1024)
+        self._text = io.TextIOWrapper(gzip.GzipFile(fileobj=self._file, mode='wb'), encoding='utf-8', newline='')
+        self._csv = csv.writer(self._text) if self.format == "csv" else None
+        if self._csv is not None:
+            self._csv.writerow(REPORT_FIELDS)
+    
+    def __len__(self):
+        return sum(self.counts.values())
+    
+    def add(self, result: CheckResult):
+        self.counts[result.status] = self.counts.get(result.status, 0) + 1
+        row = report_row(result)
+        if self._csv is not None:
+            self._csv.writerow(row)
+        else:
+            self._text.write(json.dumps(dict(zip(REPORT_FIELDS, row)), ensure_ascii=False) + "\n")
+    
+    def summary(self) -> str:
+        counts = ", ".join(f"{n} {status.name.lower()}" for status, n in sorted(self.counts.items()))
+        return f"{len(self)} names ({counts or 'none'})"
+    
+    def close(self, name: str) -> discord.File:
+        self._text.close()
+        self.size = self._file.tell()
+        self._file.seek(0)
+        return discord.File(self._file, filename=f"{name}.{self.format}.gz")
+    
+    def discard(self):
+        self._text.close()
+        self._file.close()
+
+class Subscriber:
+    __slots__ = ('data', 'channel', 'remaining', 'pending', 'lines', 'report', 'waiting')
+    
+    def __init__(self, data: 'UserData', channel, remaining: int, lines: bool = True, waiting: bool = False):
+        self.data = data
+        self.channel = channel
+        self.remaining = remaining
+        self.pending: List[str] = []
+        self.lines = lines
+        self.report = RunReport(CONFIG['REPORT_FORMAT'])
+        # One-shot job that joined during an adaptive pass; it starts with the next full pass
+        self.waiting = waiting
+    
+    def deliver(self, result: CheckResult) -> bool:
+        """Queue one result; False once a one-shot subscriber has seen every name."""
+        if self.remaining:
+            self.remaining -= 1
+        elif not self.data.loop:
+            return False
+        self.report.add(result)
+        if self.lines:
+            self.pending.append(str(result))
+        return True
+
+class CheckRun:
+    """A single check run over a shared list, fanning results out to every subscribed job."""
+    
+    def __init__(self, shared: SharedList):
+        self.shared = shared
+        self.key = f"list:{shared.digest[:12]}"
+        self.subscribers: Dict[int, Subscriber] = {}
         self.task: Optional[asyncio.Task] = None
         self.processed: int = 0
-        self.total: int = 0
-        self.last_activity: float = time.time()
-        self._lock = asyncio.Lock()
+        self.started_at: float = 0.0
+        self.checked: int = 0
+        self.recheck: Optional[RecheckQueue] = None
+        self.passes: int = 0
+        self.adaptive: bool = False
+        self.last_coverage: Optional[float] = None
+        # Filled in by the pre-flight stage before the first request
+        self.skip: Optional[bytearray] = None
+        self.preflight: Optional[PreflightStats] = None
+        self.ready = asyncio.Event()
+    
+    @property
+    def loop(self) -> bool:
+        # Adaptive passes only make sense while every subscriber keeps looping
+        return bool(self.subscribers) and all(sub.data.loop for sub in self.subscribers.values())
+    
+    @property
+    def weight(self) -> int:
+        return sum(sub.data.weight for sub in self.subscribers.values()) or 1
+    
+    @property
+    def active(self) -> bool:
+        return self.task is not None and not self.task.done()
+    
+    def throughput(self) -> float:
+        elapsed = time.monotonic() - self.started_at
+        return self.checked / elapsed if self.started_at and elapsed > 0 else 0.0
+    
+    def eta(self) -> Optional[float]:
+        rate = self.throughput()
+        return (len(self.shared.names) - self.processed) / rate if rate else None
+    
+    def checkable(self, start: int = 0) -> int:
+        if self.skip is None:
+            return len(self.shared.names) - start
+        return self.skip.count(0, start)
+    
+    def unskip_known_taken(self):
+        """Queue the names pre-flight skipped as known taken, once the run starts looping."""
+        if self.preflight is None or not self.preflight.known_taken:
+            return
+        self.skip = self.skip.replace(bytes([SKIP_TAKEN]), b"\0")
+        self.preflight = self.preflight._replace(queued=self.preflight.queued + self.preflight.known_taken, known_taken=0)
+
+class UserData:
+    __slots__ = ('user_id', 'shared', 'loop', 'weight', 'last_activity')
+    
+    def __init__(self, user_id: int, shared: Optional[SharedList], loop: bool = False):
+        self.user_id = user_id
+        self.shared = shared
+        self.loop = loop
+        self.weight = 1
+        self.last_activity = time.time()
+    
+    @property
+    def file(self) -> Optional[UsernameList]:
+        return self.shared.names if self.shared else None
+    
+    @property
+    def total(self) -> int:
+        return len(self.shared.names) if self.shared else 0
+    
+    @property
+    def run(self) -> Optional[CheckRun]:
+        run = self.shared.run if self.shared else None
+        return run if run is not None and self.user_id in run.subscribers else None
+    
+    @property
+    def running(self) -> bool:
+        run = self.run
+        return run is not None and run.active
+    
+    @property
+    def processed(self) -> int:
+        run = self.run
+        return run.processed if run else 0
+    
+    def touch(self):
+        self.last_activity = time.time()
     
     async def cleanup(self):
-        async with self._lock:
-            if self.task and not self.task.done():
-                self.task.cancel()
+        shared, self.shared = self.shared, None
+        if shared is None:
+            return
+        await unsubscribe(shared, self.user_id)
+        shared_lists.release(shared)
+
+class ExpiryTimer:
+    """Expires idle users from a heap of deadlines instead of scanning everyone.
+    
+    Activity only moves `last_activity` forward. When a deadline pops,
+    `on_expire` either expires the user or returns their new deadline,
+    which goes back on the heap. Tracking a user who already has an entry
+    is a no-op, so each user has one entry at a time.
+    """
+    
+    def __init__(self, on_expire):
+        self.on_expire = on_expire
+        self._heap: List[Tuple[float, int]] = []
+        self._tracked: Set[int] = set()
+        self._wake = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+    
+    def track(self, user_id: int, deadline: float):
+        if user_id in self._tracked:
+            # The pending entry reads the user's current deadline when it pops
+            return
+        self._tracked.add(user_id)
+        heapq.heappush(self._heap, (deadline, user_id))
+        self._wake.set()
+    
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+    
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+    
+    async def _run(self):
+        while True:
+            self._wake.clear()
+            delay = self._heap[0][0] - time.time() if self._heap else None
+            if delay is None or delay > 0:
                 try:
-                    await self.task
-                except asyncio.CancelledError:
+                    await asyncio.wait_for(self._wake.wait(), delay)
+                except asyncio.TimeoutError:
                     pass
-            self.task = None
-            self.file.clear()
-            self.processed = 0
-            self.total = 0
+                continue
+            _, user_id = heapq.heappop(self._heap)
+            # Untracked while on_expire runs, so a user re-added meanwhile gets a fresh entry
+            self._tracked.discard(user_id)
+            try:
+                deadline = await self.on_expire(user_id)
+            except Exception as e:
+                logger.error(f"Failed to expire user {user_id}: {e}")
+                continue
+            if deadline is not None:
+                self.track(user_id, deadline)
 
-class DiscordRateLimiter:
-    def __init__(self, delay: float = 1.0):
+class ChannelOutput:
+    """Per-channel send queue that coalesces pending lines into as few messages as possible.
+    
+    Attachments queued with `put_file` go out in order, after the lines queued before them.
+    """
+    
+    MESSAGE_LIMIT = 1900
+    
+    def __init__(self, channel, delay: float = 1.0, attachment_threshold: int = 3):
+        self.channel = channel
         self.delay = delay
-        self.last_message = 0.0
+        self.attachment_threshold = attachment_threshold
+        self.last_sent = 0.0
+        self._pending: deque = deque()
+        self._task: Optional[asyncio.Task] = None
+    
+    def put(self, message: str):
+        self._pending.append(message)
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+    
+    def put_file(self, content: str, file: discord.File):
+        self._pending.append((content, file))
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
     
-    async def wait_if_needed(self):
-        now = time.time()
-        time_since_last = now - self.last_message
-        if time_since_last < self.delay:
-            await asyncio.sleep(self.delay - time_since_last)
-        self.last_message = time.time()
+    async def wait_empty(self):
+        if self._task is not None and not self._task.done():
+            await self._task
+    
+    async def _run(self):
+        while self._pending:
+            # Anything queued while we wait out the channel's delay rides along
+            wait = self.delay - (time.monotonic() - self.last_sent)
+            if wait > 0:
+                await asyncio.sleep(wait)
+            
+            if not isinstance(self._pending[0], str):
+                content, file = self._pending.popleft()
+                await self._send(content=content, file=file)
+                continue
+            
+            lines = []
+            while self._pending and isinstance(self._pending[0], str):
+                lines.extend(self._pending.popleft().split("\n"))
+            messages = self._pack(lines)
+            
+            if len(messages) > self.attachment_threshold:
+                await self._send(
+                    content=f"{len(lines)} lines",
+                    file=discord.File(io.BytesIO("\n".join(lines).encode('utf-8')), filename=f"results_{int(time.time())}.txt")
+                )
+                continue
+            for i, message in enumerate(messages):
+                if i:
+                    await asyncio.sleep(self.delay)
+                await self._send(content=message)
+    
+    def _pack(self, lines: List[str]) -> List[str]:
+        messages = []
+        current = ""
+        for line in lines:
+            while len(line) > self.MESSAGE_LIMIT:
+                if current:
+                    messages.append(current)
+                    current = ""
+                messages.append(line[:self.MESSAGE_LIMIT])
+                line = line[self.MESSAGE_LIMIT:]
+            if current and len(current) + 1 + len(line) > self.MESSAGE_LIMIT:
+                messages.append(current)
+                current = line
+            else:
+                current = f"{current}\n{line}" if current else line
+        if current:
+            messages.append(current)
+        return messages
+    
+    async def _send(self, **kwargs):
+        # discord.py's HTTP client already waits out per-route rate-limit buckets
+        try:
+            with discord_send_latency.time():
+                await self.channel.send(**kwargs)
+        except discord.HTTPException as e:
+            logger.error(f"Failed to send message to channel {getattr(self.channel, 'id', '?')}: {e}")
+        self.last_sent = time.monotonic()
+
+class OutputPipeline:
+    def __init__(self, delay: float = 1.0, attachment_threshold: int = 3):
+        self.delay = delay
+        self.attachment_threshold = attachment_threshold
+        self._channels: Dict[int, ChannelOutput] = {}
+    
+    def _output(self, channel) -> ChannelOutput:
+        output = self._channels.get(channel.id)
+        if output is None:
+            output = ChannelOutput(channel, self.delay, self.attachment_threshold)
+            self._channels[channel.id] = output
+        return output
+    
+    def send(self, channel, message: str):
+        self._output(channel).put(message)
+    
+    def send_file(self, channel, content: str, file: discord.File):
+        self._output(channel).put_file(content, file)
+    
+    async def drain(self):
+        for output in list(self._channels.values()):
+            await output.wait_empty()
+
+class JobStore:
+    """SQLite checkpoint store for uploaded lists and job progress.
+    
+    Lists are stored once per content digest; job rows reference them.
+    """
+    
+    JOB_FIELDS = ('channel_id', 'loop', 'running', 'processed')
+    
+    def __init__(self, path: str, flush_interval: float = 5.0):
+        self.flush_interval = flush_interval
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""CREATE TABLE IF NOT EXISTS lists (
+            digest TEXT PRIMARY KEY,
+            names BLOB NOT NULL,
+            offsets BLOB NOT NULL)""")
+        self._conn.execute("""CREATE TABLE IF NOT EXISTS jobs (
+            user_id INTEGER PRIMARY KEY,
+            channel_id INTEGER,
+            loop INTEGER NOT NULL DEFAULT 0,
+            running INTEGER NOT NULL DEFAULT 0,
+            processed INTEGER NOT NULL DEFAULT 0,
+            digest TEXT NOT NULL,
+            updated_at REAL NOT NULL)""")
+        self._conn.commit()
+        self._lock = asyncio.Lock()
+        self._pending_progress: Dict[int, int] = {}
+        self._last_flush = time.monotonic()
+    
+    async def _run(self, fn, *args):
+        # One writer at a time, off the event loop
+        async with self._lock:
+            return await asyncio.to_thread(fn, *args)
+    
+    def _execute(self, sql: str, params=()):
+        with self._conn:
+            return self._conn.execute(sql, params).fetchall()
+    
+    async def save_job(self, user_id: int, shared: SharedList, loop: bool = False):
+        await self._run(self._save_job_sync, user_id, shared, loop)
+    
+    def _save_job_sync(self, user_id: int, shared: SharedList, loop: bool):
+        with self._conn:
+            if not self._conn.execute("SELECT 1 FROM lists WHERE digest = ?", (shared.digest,)).fetchone():
+                data, offsets = shared.names.to_bytes()
+                self._conn.execute("INSERT INTO lists (digest, names, offsets) VALUES (?, ?, ?)",
+                                   (shared.digest, data, offsets))
+            self._conn.execute(
+                "INSERT OR REPLACE INTO jobs (user_id, loop, running, processed, digest, updated_at) "
+                "VALUES (?, ?, 0, 0, ?, ?)",
+                (user_id, int(loop), shared.digest, time.time()))
+        self._drop_orphan_lists()
+    
+    def _drop_orphan_lists(self):
+        with self._conn:
+            self._conn.execute("DELETE FROM lists WHERE digest NOT IN (SELECT digest FROM jobs)")
+    
+    async def update_job(self, user_id: int, **fields):
+        unknown = set(fields) - set(self.JOB_FIELDS)
+        if unknown:
+            raise ValueError(f"Unknown job fields: {', '.join(sorted(unknown))}")
+        self._pending_progress.pop(user_id, None)
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        await self._run(self._execute,
+            f"UPDATE jobs SET {assignments}, updated_at = ? WHERE user_id = ?",
+            (*(int(v) for v in fields.values()), time.time(), user_id))
+    
+    async def delete_job(self, user_id: int):
+        self._pending_progress.pop(user_id, None)
+        await self._run(self._delete_job_sync, user_id)
+    
+    def _delete_job_sync(self, user_id: int):
+        with self._conn:
+            self._conn.execute("DELETE FROM jobs WHERE user_id = ?", (user_id,))
+        self._drop_orphan_lists()
+    
+    async def load_jobs(self) -> List[Tuple[int, Optional[int], bool, bool, int, str, UsernameList]]:
+        jobs = await self._run(self._execute,
+            "SELECT user_id, channel_id, loop, running, processed, digest FROM jobs")
+        rows = await self._run(self._execute,
+            "SELECT digest, names, offsets FROM lists WHERE digest IN (SELECT digest FROM jobs)")
+        lists = {digest: UsernameList.from_bytes(names, offsets) for digest, names, offsets in rows}
+        return [
+            (user_id, channel_id, bool(loop), bool(running), processed, digest, lists[digest])
+            for user_id, channel_id, loop, running, processed, digest in jobs if digest in lists
+        ]
+    
+    def progress(self, user_id: int, processed: int):
+        self._pending_progress[user_id] = processed
+    
+    async def maybe_flush(self):
+        if time.monotonic() - self._last_flush >= self.flush_interval:
+            await self.flush()
+    
+    async def flush(self):
+        progress = [(processed, time.time(), user_id) for user_id, processed in self._pending_progress.items()]
+        self._pending_progress = {}
+        self._last_flush = time.monotonic()
+        if progress:
+            await self._run(self._flush_sync, progress)
+    
+    def _flush_sync(self, progress):
+        with self._conn:
+            self._conn.executemany("UPDATE jobs SET processed = ?, updated_at = ? WHERE user_id = ?", progress)
+    
+    async def close(self):
+        await self.flush()
+        self._conn.close()
+
+class CheckerBot(commands.Bot):
+    async def close(self):
+        expiry_timer.stop()
+        if worker_pool is not None:
+            await worker_pool.close()
+        if metrics_runner is not None:
+            await metrics_runner.cleanup()
+        try:
+            await asyncio.wait_for(output_pipeline.drain(), 10)
+        except asyncio.TimeoutError:
+            logger.warning("Timed out flushing pending Discord output")
+        await save_taken_filter()
+        await job_store.close()
+        await api_client.close()
+        await super().close()
 
-USER_AGENTS = generate_user_agents(1000)
 intents = discord.Intents.default()
 intents.message_content = True
-bot = commands.Bot(command_prefix="!", intents=intents)
+bot = CheckerBot(command_prefix="!", intents=intents)
+job_store = JobStore(CONFIG['JOB_DB_PATH'], CONFIG['STORE_FLUSH_INTERVAL'])
 user_data: Dict[int, UserData] = {}
-discord_rate_limiter = DiscordRateLimiter(CONFIG['DISCORD_MESSAGE_DELAY'])
+shared_lists = ListRegistry()
+taken_filter = AgingBloomFilter.load(CONFIG['TAKEN_FILTER_PATH'], CONFIG['TAKEN_FILTER_CAPACITY'],
+                                     CONFIG['TAKEN_FILTER_WINDOW'])
+_taken_filter_lock = asyncio.Lock()
+expiry_timer = ExpiryTimer(lambda user_id: expire_user(user_id))
+output_pipeline = OutputPipeline(CONFIG['DISCORD_MESSAGE_DELAY'], CONFIG['OUTPUT_ATTACHMENT_THRESHOLD'])
+metrics_runner = None
+worker_pool: Optional[WorkerPool] = None
+
+def _running_runs() -> List[CheckRun]:
+    return [shared.run for shared in shared_lists if shared.run is not None and shared.run.active]
+
+metrics.gauge('cops_job_names_per_second', 'Per-run check throughput',
+              lambda: [({'job': run.key}, round(run.throughput(), 3)) for run in _running_runs()])
+metrics.gauge('cops_job_eta_seconds', 'Estimated seconds left in the current pass',
+              lambda: [({'job': run.key}, round(run.eta(), 1)) for run in _running_runs() if run.eta() is not None])
+metrics.gauge('cops_job_progress', 'Names processed in the current pass',
+              lambda: [({'job': run.key}, run.processed) for run in _running_runs()])
+metrics.gauge('cops_job_subscribers', 'Jobs sharing each check run',
+              lambda: [({'job': run.key}, len(run.subscribers)) for run in _running_runs()])
+metrics.gauge('cops_shared_lists', 'Distinct uploaded lists held in memory',
+              lambda: [({}, len(shared_lists))])
+metrics.gauge('cops_cache_lookups', 'Availability cache lookups by outcome',
+              lambda: [({'result': 'hit'}, availability_cache.hits), ({'result': 'miss'}, availability_cache.misses),
+                       ({'result': 'shared'}, availability_cache.shared)])
+metrics.gauge('cops_scheduler_rate', 'Current global request rate (requests/s)',
+              lambda: [({}, request_scheduler.rate)])
+metrics.gauge('cops_scheduler_queued', 'Requests waiting for a token',
+              lambda: [({}, request_scheduler.pending())])
+
+def _format_seconds(seconds: Optional[float]) -> str:
+    if seconds is None:
+        return "unknown"
+    minutes, secs = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}h{minutes:02d}m{secs:02d}s" if hours else f"{minutes}m{secs:02d}s"
 
 def has_role(member, role_name):
     return any(role.name == role_name for role in member.roles)
@@ -165,72 +1045,326 @@ def is_owner_or_has_permission(interaction: discord.Interaction) -> bool:
     return False
 
 async def safe_send(channel, message: str):
-    await discord_rate_limiter.wait_if_needed()
+    output_pipeline.send(channel, message)
+
+async def _fetch_locally(names: List[str], lookup_size: int) -> List[CheckResult]:
+    batches = await asyncio.gather(*(
+        fetch_usernames_batch(names[j:j + lookup_size])
+        for j in range(0, len(names), lookup_size)
+    ))
+    return [result for batch in batches for result in batch]
+
+async def _fetch_on_workers(job, names: List[str], lookup_size: int) -> List[CheckResult]:
+    # Only the shards whose worker failed are checked again here
+    return await worker_pool.check(job, names, lookup_size, lambda shard: _fetch_locally(shard, lookup_size))
+
+async def check_chunk(job, chunk: List[str], lookup_size: int, use_cache: bool = True) -> List[CheckResult]:
+    if worker_pool is not None and worker_pool.ready and chunk:
+        # Cache hits and in-flight dedup stay here; only the misses are sharded
+        return await check_usernames_batch(chunk, use_cache, lambda names: _fetch_on_workers(job, names, lookup_size))
+    batches = await asyncio.gather(*(
+        check_usernames_batch(chunk[j:j + lookup_size], use_cache)
+        for j in range(0, len(chunk), lookup_size)
+    ))
+    return [result for batch in batches for result in batch]
+
+async def _pass_chunks(run: CheckRun, start_index: int, chunk_size: int, adaptive: bool):
+    """Yield (indices, position) chunks; position is the pass progress after the chunk, or None when adaptive."""
+    if not adaptive:
+        skip = run.skip
+        indices = []
+        for i in range(start_index, len(skip)):
+            if skip[i]:
+                continue
+            indices.append(i)
+            if len(indices) >= chunk_size:
+                yield indices, i + 1
+                indices = []
+        if indices:
+            yield indices, len(skip)
+        return
     
-    if len(message) > 1900:
-        chunks = [message[i:i+1900] for i in range(0, len(message), 1900)]
-        for chunk in chunks:
-            try:
-                await channel.send(chunk)
-                await discord_rate_limiter.wait_if_needed()
-            except discord.HTTPException as e:
-                logger.error(f"Failed to send message chunk: {e}")
-    else:
+    # An adaptive pass spends the same request budget as a full pass,
+    # but on whichever names are due first.
+    budget = run.recheck.checkable
+    while budget > 0 and run.loop:
+        indices, wait = run.recheck.pop_due(min(chunk_size, budget), time.time())
+        if not indices:
+            # Backed-off names can be hours away; a waiting loop is still active
+            for sub in run.subscribers.values():
+                sub.data.touch()
+            await asyncio.sleep(min(wait, 5.0))
+            continue
+        budget -= len(indices)
+        yield indices, None
+
+async def _flush_subscriber(sub: Subscriber):
+    if sub.pending:
         try:
-            await channel.send(message)
-        except discord.HTTPException as e:
-            logger.error(f"Failed to send message: {e}")
+            await safe_send(sub.channel, "\n".join(sub.pending))
+        except Exception as e:
+            logger.error(f"Failed to send batch message: {e}")
+        sub.pending = []
 
-async def check_username_availability(username: str) -> str:
-    username = username.strip()
-    if not username:
-        return "Empty username skipped"
+def _send_report(run: CheckRun, sub: Subscriber, renew: bool):
+    report = sub.report
+    sub.report = RunReport(CONFIG['REPORT_FORMAT']) if renew else None
+    if not len(report):
+        report.discard()
+        return
+    file = report.close(f"report_{run.shared.digest[:8]}_{int(time.time())}")
+    summary = f"Run report: {report.summary()}"
+    if report.size > CONFIG['REPORT_MAX_BYTES']:
+        file.close()
+        output_pipeline.send(sub.channel, f"{summary}. The report is {report.size} bytes, too large to attach.")
+    else:
+        output_pipeline.send_file(sub.channel, summary, file)
+
+async def _finish_subscriber(run: CheckRun, user_id: int):
+    sub = run.subscribers.pop(user_id)
+    await _flush_subscriber(sub)
+    _send_report(run, sub, renew=False)
+    request_scheduler.register(run.key, run.weight)
+    await job_store.update_job(user_id, running=False, processed=0)
+    logger.info(f"Check run {run.key} finished for user {user_id}")
+
+async def process_run(run: CheckRun, hits_channel, start_index: int = 0):
+    usernames = run.shared.names
+    current_job.set(run.key)
+    logger.info(f"Starting check run {run.key} for {len(run.subscribers)} job(s) at {start_index}")
+    first_pass = True
+    run.started_at = time.monotonic()
+    run.checked = 0
     
-    for attempt in range(3):
-        url = f"https://api-cops.criticalforce.fi/api/public/profile?usernames={username}"
-        headers = {"User-Agent": random.choice(USER_AGENTS)}
-        
+    if run.skip is None:
+        try:
+            # Known-taken names are only skipped for one-shot runs; loop mode
+            # exists to catch taken names coming free. The filter forgets names
+            # after TAKEN_FILTER_WINDOW so freed ones get checked again.
+            taken_filter.rotate()
+            run.skip, run.preflight = await asyncio.to_thread(
+                preflight, usernames, username_rules, None if run.loop else taken_filter)
+        except Exception as e:
+            logger.error(f"Pre-flight failed for check run {run.key}: {e}")
+            for user_id, sub in list(run.subscribers.items()):
+                sub.report.discard()
+                await job_store.update_job(user_id, running=False)
+            run.subscribers.clear()
+            return
+        finally:
+            run.ready.set()
+        for sub in run.subscribers.values():
+            sub.remaining = run.checkable(start_index)
+        logger.info(f"Pre-flight for {run.key}: {run.preflight.queued} queued, {run.preflight.invalid} invalid, "
+                    f"{run.preflight.duplicates} duplicates, {run.preflight.known_taken} known taken")
+    
+    while run.subscribers:
         try:
-            response = requests.get(url, headers=headers, timeout=10)
-            logger.debug(f"Response status for {username}: {response.status_code}")
+            lookup_size = max(1, CONFIG['LOOKUP_BATCH_SIZE'])
+            chunk_size = max(1, CONFIG['JOB_CONCURRENCY']) * lookup_size
+            if run.loop and run.recheck is None:
+                # Pre-flight ran while the run was one-shot (/start, then /on)
+                run.unskip_known_taken()
+                run.recheck = RecheckQueue(len(usernames), CONFIG['LOOP_BASE_INTERVAL'], CONFIG['LOOP_MAX_BACKOFF'], run.skip)
+            adaptive = run.recheck is not None and not first_pass and run.loop
+            run.adaptive = adaptive
+            if run.recheck is not None:
+                run.recheck.begin_pass()
+            if not adaptive:
+                for sub in run.subscribers.values():
+                    if sub.waiting:
+                        sub.waiting = False
+                        sub.remaining = run.checkable(start_index)
+            pass_done = start_index
             
-            if response.status_code == 200:
-                try:
-                    data = response.json()
-                    if ("error" in data and data["error"] == 53) or (isinstance(data, list) and len(data) == 0):
-                        return f"{username} ✓"
-                    else:
-                        return f"{username} ✗"
-                except (json.JSONDecodeError, ValueError) as e:
-                    logger.warning(f"JSON parsing error for {username}: {e}")
-                    if attempt == 2:
-                        return f"{username} - JSON parse error"
-            elif response.status_code == 500:
-                return f"{username} ✓"
-            elif response.status_code == 403:
-                logger.warning(f"403 Forbidden for {username} (attempt {attempt + 1})")
-                if attempt < 2:
-                    await asyncio.sleep(2.0)
-                    continue
-                return f"{username} - blocked (403)"
-            else:
-                logger.warning(f"Unexpected HTTP {response.status_code} for {username}")
-                if attempt == 2:
-                    return f"{username} - HTTP {response.status_code}"
+            async for indices, position in _pass_chunks(run, start_index, chunk_size, adaptive):
+                chunk = [usernames[i] for i in indices]
+                pass_done = pass_done + len(indices) if position is None else position
+                # A due recheck needs a real answer: the cache would replay one
+                # up to CACHE_TAKEN_TTL old and count it as a fresh check
+                results = await check_chunk(run.key, chunk, lookup_size, use_cache=not adaptive)
+                run.processed = pass_done
+                run.checked += len(chunk)
+                
+                now = time.time()
+                subscribers = list(run.subscribers.values())
+                for index, result in zip(indices, results):
+                    if result.status == Status.TAKEN:
+                        taken_filter.add(result.username)
+                    if run.recheck is not None:
+                        run.recheck.record(index, result, now)
+
+                    if result.available:
+                        try:
+                            await safe_send(hits_channel, f"<@{CONFIG['OWNER_ID']}> {result}")
+                        except Exception as e:
+                            logger.error(f"Failed to send hit to private channel: {e}")
                     
-        except requests.Timeout:
-            logger.warning(f"Timeout for {username} (attempt {attempt + 1})")
-            if attempt == 2:
-                return f"{username} - timeout"
-        except requests.RequestException as e:
-            logger.warning(f"Request error for {username}: {e}")
-            if attempt == 2:
-                return f"{username} - request error"
-        
-        if attempt < 2:
-            await asyncio.sleep(1.0)
+                    for sub in subscribers:
+                        if not sub.waiting:
+                            sub.deliver(result)
+                
+                for user_id, sub in list(run.subscribers.items()):
+                    sub.data.last_activity = now
+                    job_store.progress(user_id, run.processed)
+                    if not sub.remaining and not sub.data.loop:
+                        # Joined part-way through; it has now seen every name once
+                        await _finish_subscriber(run, user_id)
+                    elif len(sub.pending) >= CONFIG['BATCH_SIZE']:
+                        await _flush_subscriber(sub)
+                
+                await job_store.maybe_flush()
+                if not run.subscribers:
+                    break
+
+            for sub in run.subscribers.values():
+                await _flush_subscriber(sub)
+
+            run.processed = 0
+            run.passes += 1
+            if run.recheck is not None and run.loop:
+                run.last_coverage = run.recheck.coverage()
+            await job_store.flush()
+            await save_taken_filter()
+            
+            for user_id, sub in list(run.subscribers.items()):
+                if sub.data.loop:
+                    sub.waiting = False
+                    sub.remaining = run.checkable()
+                    _send_report(run, sub, renew=True)
+                    await job_store.update_job(user_id, processed=0)
+                elif sub.waiting:
+                    # Its full pass starts next, from the top of the list
+                    continue
+                elif adaptive or not sub.remaining:
+                    # After an adaptive pass this is a job that switched looping off
+                    logger.info(f"Looping disabled, stopping user {user_id}")
+                    await _finish_subscriber(run, user_id)
+            start_index = 0
+            first_pass = False
+                
+        except asyncio.CancelledError:
+            logger.info(f"Check run {run.key} cancelled")
+            return
+        except Exception as e:
+            logger.error(f"Error in check run {run.key}: {e}")
+            for user_id, sub in list(run.subscribers.items()):
+                sub.report.discard()
+                try:
+                    await job_store.update_job(user_id, running=False)
+                    await safe_send(sub.channel, f"Error occurred during processing: {str(e)}")
+                except:
+                    pass
+            run.subscribers.clear()
+            break
+
+async def save_taken_filter():
+    if not taken_filter.dirty:
+        return
+    async with _taken_filter_lock:
+        try:
+            await asyncio.to_thread(taken_filter.save, CONFIG['TAKEN_FILTER_PATH'])
+        except OSError as e:
+            logger.warning(f"Could not save taken-name filter to {CONFIG['TAKEN_FILTER_PATH']}: {e}")
+
+def _run_finished(run: CheckRun):
+    request_scheduler.unregister(run.key)
+    if run.shared.run is run:
+        run.shared.run = None
+
+def subscribe(data: UserData, channel, hits_channel, start_index: int = 0, lines: Optional[bool] = None) -> CheckRun:
+    """Attach a job to its list's check run, starting the run if none is active."""
+    shared = data.shared
+    run = shared.run
+    lines = CONFIG['RESULT_LINES'] if lines is None else lines
+    if run is not None and run.active:
+        # A late subscriber sees every name once, wrapping around the list. An
+        # adaptive pass rechecks names out of order, so a one-shot job joining
+        # one waits for the full pass that follows.
+        waiting = run.adaptive and not data.loop
+        run.subscribers[data.user_id] = Subscriber(data, channel, run.checkable(), lines, waiting)
+        request_scheduler.register(run.key, run.weight)
+        return run
     
-    return f"{username} - failed after 3 attempts"
+    run = CheckRun(shared)
+    shared.run = run
+    run.subscribers[data.user_id] = Subscriber(data, channel, len(shared.names) - start_index, lines)
+    request_scheduler.register(run.key, run.weight)
+    run.task = asyncio.create_task(process_run(run, hits_channel, start_index))
+    run.task.add_done_callback(lambda _: _run_finished(run))
+    return run
+
+async def unsubscribe(shared: SharedList, user_id: int):
+    run = shared.run
+    if run is None or user_id not in run.subscribers:
+        return
+    run.subscribers.pop(user_id).report.discard()
+    if run.subscribers:
+        request_scheduler.register(run.key, run.weight)
+        return
+    if run.active:
+        run.task.cancel()
+        try:
+            await run.task
+        except asyncio.CancelledError:
+            pass
+
+async def expire_user(user_id: int) -> Optional[float]:
+    data = user_data.get(user_id)
+    if data is None:
+        return None
+    deadline = data.last_activity + CONFIG['INACTIVITY_TIMEOUT']
+    if deadline > time.time():
+        return deadline
+    logger.info(f"Cleaning up inactive user {user_id}")
+    del user_data[user_id]
+    await data.cleanup()
+    await job_store.delete_job(user_id)
+    return None
+
+def add_user_data(user_id: int, shared: SharedList, loop: bool = False) -> UserData:
+    data = UserData(user_id, shared, loop)
+    user_data[user_id] = data
+    expiry_timer.track(user_id, data.last_activity + CONFIG['INACTIVITY_TIMEOUT'])
+    return data
+
+async def resume_jobs():
+    hits_channel = bot.get_channel(CONFIG['HITS_CHANNEL_ID'])
+    for user_id, channel_id, loop, running, processed, digest, usernames in await job_store.load_jobs():
+        if user_id in user_data:
+            continue
+        data = add_user_data(user_id, shared_lists.acquire(usernames, digest), loop)
+        if not running:
+            continue
+        
+        channel = bot.get_channel(channel_id) if channel_id else None
+        if channel is None or hits_channel is None:
+            logger.warning(f"Cannot resume job for user {user_id}: channel not found")
+            await job_store.update_job(user_id, running=False)
+            continue
+        run = subscribe(data, channel, hits_channel, processed)
+        logger.info(f"Resumed job for user {user_id} on run {run.key} from {processed}/{data.total}")
+
+async def start_workers():
+    global worker_pool
+    if worker_pool is not None or CONFIG['WORKER_PROCESSES'] <= 0:
+        return
+    worker_pool = WorkerPool(CONFIG['WORKER_PROCESSES'], CONFIG['WORKER_SOCKET'], request_scheduler, retry_policy)
+    try:
+        await worker_pool.start()
+    except OSError as e:
+        logger.error(f"Failed to start worker processes: {e}")
+        worker_pool = None
+
+async def start_metrics():
+    global metrics_runner
+    if metrics_runner is not None or not CONFIG['METRICS_PORT']:
+        return
+    try:
+        metrics_runner = await start_metrics_server(metrics, CONFIG['METRICS_HOST'], CONFIG['METRICS_PORT'])
+        logger.info(f"Metrics available at http://{CONFIG['METRICS_HOST']}:{CONFIG['METRICS_PORT']}/metrics")
+    except OSError as e:
+        logger.error(f"Failed to start metrics server: {e}")
 
 @bot.event
 async def on_ready():
@@ -242,21 +1376,10 @@ async def on_ready():
             logger.info(f"  - /{cmd.name}: {cmd.description}")
     except Exception as e:
         logger.error(f"Failed to sync slash commands: {e}")
-    cleanup_inactive_users.start()
-
-@tasks.loop(minutes=30)
-async def cleanup_inactive_users():
-    current_time = time.time()
-    inactive_users = []
-    
-    for user_id, data in user_data.items():
-        if current_time - data.last_activity > 3600:
-            inactive_users.append(user_id)
-    
-    for user_id in inactive_users:
-        logger.info(f"Cleaning up inactive user {user_id}")
-        await user_data[user_id].cleanup()
-        del user_data[user_id]
+    await start_workers()
+    await resume_jobs()
+    await start_metrics()
+    expiry_timer.start()
 
 @bot.tree.command(name="add", description="Add a user to the allowed users list (Owner only)")
 async def add_user_slash(interaction: discord.Interaction, user: discord.User):
@@ -287,35 +1410,38 @@ async def upload_file_slash(interaction: discord.Interaction, attachment: discor
         await interaction.response.send_message("You don't have permission to use this command.", ephemeral=True)
         return
     
-    if not attachment.filename.endswith(".txt"):
-        await interaction.response.send_message("Only .txt files are supported.", ephemeral=True)
+    if not attachment.filename.endswith((".txt", ".txt.gz")):
+        await interaction.response.send_message("Only .txt or .txt.gz files are supported.", ephemeral=True)
         return
     
     if attachment.size > CONFIG['MAX_FILE_SIZE']:
         await interaction.response.send_message(f"File too large. Maximum size: {CONFIG['MAX_FILE_SIZE']} bytes", ephemeral=True)
         return
     
+    await interaction.response.defer()
+    
     try:
-        content = await attachment.read()
-        usernames = content.decode('utf-8', errors='ignore').splitlines()
-        usernames = [u.strip() for u in usernames if u.strip()]
+        ingest = await ingest_attachment(attachment, CONFIG['MAX_USERNAMES'])
+        usernames = ingest.usernames
         
         if interaction.user.id in user_data:
             await user_data[interaction.user.id].cleanup()
         
-        user_data[interaction.user.id] = UserData()
-        user_data[interaction.user.id].file = usernames
-        user_data[interaction.user.id].total = len(usernames)
-        user_data[interaction.user.id].last_activity = time.time()
+        shared = shared_lists.acquire(usernames)
+        add_user_data(interaction.user.id, shared)
+        await job_store.save_job(interaction.user.id, shared)
         
-        logger.info(f"User {interaction.user} uploaded file with {len(usernames)} usernames")
-        await interaction.response.send_message(f"File uploaded. {len(usernames)} usernames stored.")
+        note = " An identical list is already loaded; /start will share its check run." if shared.refs > 1 else ""
+        logger.info(f"User {interaction.user} uploaded file with {len(usernames)} usernames ({ingest.duplicates} duplicates dropped, list {shared.digest[:12]}, {shared.refs} refs)")
+        await interaction.followup.send(f"File uploaded. {len(usernames)} usernames stored ({ingest.duplicates} duplicates removed).{note}")
         
-    except UnicodeDecodeError:
-        await interaction.response.send_message("File encoding error. Please use UTF-8 encoding.", ephemeral=True)
+    except zlib.error:
+        await interaction.followup.send("Could not decompress file. Please upload a valid .gz file.", ephemeral=True)
+    except ValueError as e:
+        await interaction.followup.send(f"File rejected: {e}.", ephemeral=True)
     except Exception as e:
         logger.error(f"File upload error: {e}")
-        await interaction.response.send_message("Error processing file.", ephemeral=True)
+        await interaction.followup.send("Error processing file.", ephemeral=True)
 
 @bot.tree.command(name="on", description="Enable looping for continuous checking")
 async def loop_on_slash(interaction: discord.Interaction):
@@ -327,7 +1453,8 @@ async def loop_on_slash(interaction: discord.Interaction):
         return
     
     user_data[interaction.user.id].loop = True
-    user_data[interaction.user.id].last_activity = time.time()
+    user_data[interaction.user.id].touch()
+    await job_store.update_job(interaction.user.id, loop=True)
     logger.info(f"Looping enabled for user {interaction.user}")
     await interaction.response.send_message("Looping enabled for your account.")
 
@@ -341,14 +1468,16 @@ async def loop_off_slash(interaction: discord.Interaction):
         return
     
     user_data[interaction.user.id].loop = False
-    user_data[interaction.user.id].last_activity = time.time()
+    user_data[interaction.user.id].touch()
+    await job_store.update_job(interaction.user.id, loop=False)
     logger.info(f"Looping disabled for user {interaction.user}")
     await interaction.response.send_message("Looping disabled for your account.")
 
 @bot.tree.command(name="kill", description="Stop the current checking process")
 async def kill_task_slash(interaction: discord.Interaction):
     if interaction.user.id in user_data:
-        await user_data[interaction.user.id].cleanup()
+        await user_data.pop(interaction.user.id).cleanup()
+        await job_store.delete_job(interaction.user.id)
         await interaction.response.send_message("Your batch check has been stopped and cleaned up.")
         logger.info(f"Task killed for user {interaction.user}")
     else:
@@ -361,18 +1490,72 @@ async def check_status_slash(interaction: discord.Interaction):
         return
     
     data = user_data[interaction.user.id]
-    status = "Running" if data.task and not data.task.done() else "Stopped"
+    run = data.run
+    status = "Running" if data.running else "Stopped"
+    if data.running and len(run.subscribers) > 1:
+        status += f" (shared with {len(run.subscribers) - 1} other job(s))"
     progress = f"{data.processed}/{data.total}" if data.total > 0 else "0/0"
     loop_status = "Enabled" if data.loop else "Disabled"
+    passes = run.passes if run else 0
+    coverage = f"{run.last_coverage:.1%}" if run and run.last_coverage is not None else "n/a"
+    
+    cache = availability_cache
     
     await interaction.response.send_message(f"**Status Report**\n"
                                           f"Status: {status}\n"
                                           f"Progress: {progress}\n"
                                           f"Looping: {loop_status}\n"
-                                          f"Total usernames: {data.total}")
+                                          f"Total usernames: {data.total}\n"
+                                          f"Passes: {passes} (last pass covered {coverage} of names)\n"
+                                          f"Cache: {cache.hits} hits, {cache.misses} misses, {cache.shared} shared in-flight ({len(cache)} entries)\n"
+                                          f"API rate: {request_scheduler.rate:.2f}/s, {request_scheduler.pending()} queued")
+
+@bot.tree.command(name="stats", description="Show checker performance statistics")
+async def stats_slash(interaction: discord.Interaction):
+    if not is_owner_or_has_permission(interaction):
+        await interaction.response.send_message("You don't have permission to use this command.", ephemeral=True)
+        return
+    
+    statuses = ", ".join(f"{code}: {n}" for code, n in sorted(api_responses.values.items())) or "none"
+    retry_reasons = ", ".join(f"{reason}: {n}" for reason, n in sorted(retries.values.items())) or "none"
+    denied = ", ".join(f"{reason}: {n}" for reason, n in sorted(retries_denied.values.items())) or "none"
+    lines = [
+        "**Checker Stats**",
+        f"API latency: p50 {api_latency.quantile(0.5) * 1000:.0f} ms, p99 {api_latency.quantile(0.99) * 1000:.0f} ms ({api_latency.count} requests)",
+        f"Responses: {statuses}",
+        f"Retries: {retry_reasons} (skipped: {denied}, budget {retry_policy.tokens:.1f})",
+        f"Circuit breaker: {circuit_breaker.state.replace('_', '-')} ({circuit_breaker.trips} trips)",
+        f"Scheduler wait: p50 {scheduler_wait.quantile(0.5) * 1000:.0f} ms, p99 {scheduler_wait.quantile(0.99) * 1000:.0f} ms, rate {request_scheduler.rate:.2f}/s",
+        f"Discord sends: p50 {discord_send_latency.quantile(0.5) * 1000:.0f} ms ({discord_send_latency.count} sent)",
+    ]
+    lines.append(f"Lists: {len(shared_lists)} held, {sum(len(shared.names) for shared in shared_lists)} names")
+    for run in _running_runs():
+        jobs = ", ".join(f"<@{uid}>" for uid in run.subscribers)
+        lines.append(f"Run {run.key} ({jobs}): {run.processed}/{len(run.shared.names)}, {run.throughput():.1f} names/s, ETA {_format_seconds(run.eta())}")
+    
+    await interaction.response.send_message("\n".join(lines))
+
+@bot.tree.command(name="profile", description="Sample where the bot spends its time (Owner only)")
+async def profile_slash(interaction: discord.Interaction, seconds: int = 30):
+    if interaction.user.id != CONFIG['OWNER_ID']:
+        await interaction.response.send_message("Only the owner can use this command.", ephemeral=True)
+        return
+    if not 1 <= seconds <= 300:
+        await interaction.response.send_message("Seconds must be between 1 and 300.", ephemeral=True)
+        return
+    
+    await interaction.response.defer()
+    profiler = await profile_event_loop(seconds, thread_id=threading.get_ident())
+    report = io.BytesIO(profiler.report().encode('utf-8'))
+    await interaction.followup.send(
+        content=f"Profiled the event loop for {seconds}s ({profiler.samples} samples)",
+        file=discord.File(report, filename="profile.txt")
+    )
+    logger.info(f"Owner profiled the event loop for {seconds}s")
 
 @bot.tree.command(name="start", description="Start checking usernames")
-async def start_check_slash(interaction: discord.Interaction):
+@app_commands.describe(lines="Post every result as it arrives (a compressed report is attached at the end either way)")
+async def start_check_slash(interaction: discord.Interaction, lines: Optional[bool] = None):
     if not is_owner_or_has_permission(interaction):
         await interaction.response.send_message("You don't have permission to use this command.", ephemeral=True)
         return
@@ -381,7 +1564,7 @@ async def start_check_slash(interaction: discord.Interaction):
         return
     
     data = user_data[interaction.user.id]
-    if data.task and not data.task.done():
+    if data.running:
         await interaction.response.send_message("You already have a running process. Use /kill to stop it first.", ephemeral=True)
         return
 
@@ -390,71 +1573,37 @@ async def start_check_slash(interaction: discord.Interaction):
         await interaction.response.send_message("Could not find hits channel.", ephemeral=True)
         return
 
-    async def process_usernames_loop():
-        data = user_data[interaction.user.id]
-        usernames = data.file
-        logger.info(f"Starting username check for user {interaction.user}")
-        
-        while True:
-            try:
-                batch_messages = []
-                for i, username in enumerate(usernames):
-                    data.processed = i + 1
-                    data.last_activity = time.time()
-                    
-                    if data.task and data.task.cancelled():
-                        return
-                    
-                    result = await check_username_availability(username)
-                    batch_messages.append(result)
-
-                    if "✗" not in result and "error" not in result and "timeout" not in result and "failed" not in result:
-                        try:
-                            await safe_send(hits_channel, f"<@{CONFIG['OWNER_ID']}> {result}")
-                        except Exception as e:
-                            logger.error(f"Failed to send hit to private channel: {e}")
-
-                    if len(batch_messages) >= CONFIG['BATCH_SIZE']:
-                        try:
-                            await safe_send(interaction.channel, "\n".join(batch_messages))
-                            batch_messages = []
-                        except Exception as e:
-                            logger.error(f"Failed to send batch message: {e}")
-
-                    await asyncio.sleep(random.uniform(CONFIG['REQUEST_DELAY_MIN'], CONFIG['REQUEST_DELAY_MAX']))
-
-                if batch_messages:
-                    try:
-                        await safe_send(interaction.channel, "\n".join(batch_messages))
-                    except Exception as e:
-                        logger.error(f"Failed to send final batch: {e}")
-
-                data.processed = 0
-                
-                if not data.loop:
-                    logger.info(f"Looping disabled, stopping user {interaction.user}")
-                    break
-                    
-            except asyncio.CancelledError:
-                logger.info(f"Task cancelled for user {interaction.user}")
-                return
-            except Exception as e:
-                logger.error(f"Error in processing loop for user {interaction.user}: {e}")
-                try:
-                    await safe_send(interaction.channel, f"Error occurred during processing: {str(e)}")
-                except:
-                    pass
-                break
-
-    task = asyncio.create_task(process_usernames_loop())
-    data.task = task
-    data.last_activity = time.time()
+    joined = data.shared.run is not None and data.shared.run.active
+    run = subscribe(data, interaction.channel, hits_channel, lines=lines)
+    data.touch()
+    await job_store.update_job(interaction.user.id, channel_id=interaction.channel.id, running=True, processed=0)
     
-    await interaction.response.send_message(f"Started checking {len(data.file)} usernames. Looping: {data.loop}")
+    await interaction.response.defer()
+    await run.ready.wait()
+    stats = run.preflight
+    if stats is None:
+        await interaction.followup.send("Pre-flight checks failed; the job was not started.")
+        return
+    skipped = (f"Pre-flight skipped {stats.invalid} invalid, {stats.duplicates} duplicate and "
+               f"{stats.known_taken} known-taken names; {stats.queued} will be checked.")
+    if run.loop and not stats.known_taken:
+        skipped += " Looping runs recheck known-taken names."
+    if joined:
+        await interaction.followup.send(f"Joined the running check of this list ({len(data.file)} usernames, {len(run.subscribers)} jobs). Looping: {data.loop}\n{skipped}")
+    else:
+        await interaction.followup.send(f"Started checking {len(data.file)} usernames. Looping: {data.loop}\n{skipped}")
     logger.info(f"Task started for user {interaction.user}")
 
 @bot.tree.command(name="gen", description="Generate valuable IGNs and get them as a .txt file")
-async def generate_igns_command(interaction: discord.Interaction, amount: int = 500):
+@app_commands.describe(
+    min_len="Minimum name length",
+    max_len="Maximum name length",
+    prefix="Only names starting with this",
+    pattern="Consonant/vowel shape, e.g. CVCVC",
+    ranked="Favour short, rare-lettered, pronounceable names over a plain shuffle"
+)
+async def generate_igns_command(interaction: discord.Interaction, amount: int = 500, min_len: int = 3,
+                                max_len: int = 12, prefix: str = "", pattern: str = "", ranked: bool = False):
     if not is_owner_or_has_permission(interaction):
         await interaction.response.send_message("You don't have permission to use this command.", ephemeral=True)
         return
@@ -465,18 +1614,35 @@ async def generate_igns_command(interaction: discord.Interaction, amount: int =
     if amount > 2000:
         await interaction.response.send_message("Maximum amount is 2000 IGNs.", ephemeral=True)
         return
+    # Dictionary names are 3-12 characters
+    min_len, max_len = max(min_len, 3), min(max_len, 12)
+    if min_len > max_len:
+        await interaction.response.send_message("min_len can't be greater than max_len.", ephemeral=True)
+        return
+    if pattern and not set(pattern.upper()) <= {"C", "V"}:
+        await interaction.response.send_message("Pattern may only contain C (consonant) and V (vowel).", ephemeral=True)
+        return
+    if ranked and np is None:
+        await interaction.response.send_message("Ranked generation needs numpy installed on the bot host.", ephemeral=True)
+        return
     
     await interaction.response.defer()
     
     try:
-        igns = generate_igns(amount)
+        if _dictionary_index is None or (ranked and _dictionary_scores is None):
+            # First /gen compiles or maps the dictionary (and scores it); keep it off the event loop
+            await asyncio.to_thread(get_dictionary_scores if ranked else get_dictionary_index)
+        igns = generate_igns(amount, min_len, max_len, prefix, pattern, ranked)
+        if not igns:
+            await interaction.followup.send("No dictionary words match those filters.", ephemeral=True)
+            return
         file_content = "\n".join(igns)
         file_bytes = io.BytesIO(file_content.encode('utf-8'))
         file_bytes.seek(0)
         discord_file = discord.File(file_bytes, filename=f"valuable_igns_{len(igns)}.txt")
         
         await interaction.followup.send(
-            content=f"Generated **{len(igns)}** unique valuable IGNs",
+            content=f"Generated **{len(igns)}** unique valuable IGNs" + (", best first" if ranked else ""),
             file=discord_file
         )
         logger.info(f"User {interaction.user} generated {len(igns)} IGNs")
@@ -485,4 +1651,5 @@ async def generate_igns_command(interaction: discord.Interaction, amount: int =
         logger.error(f"Error generating IGNs: {e}")
         await interaction.followup.send("An error occurred while generating IGNs.", ephemeral=True)
 
-bot.run(CONFIG['TOKEN'])
\ No newline at end of file
+if __name__ == "__main__":
+    bot.run(CONFIG['TOKEN'])